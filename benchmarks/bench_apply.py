@@ -0,0 +1,48 @@
+import argparse
+import copy
+import json
+import subprocess
+import timeit
+import types
+from pathlib import Path
+
+from slurmrest import improve
+
+
+def revision(rev):
+    # improve.py as of a git revision, to compare before/after
+    src = subprocess.run(["git", "show", f"{rev}:slurmrest/improve.py"], capture_output=True, check=True).stdout
+    m = types.ModuleType(f"improve@{rev}")
+    m.__file__ = improve.__file__
+    exec(compile(src, f"{rev}:slurmrest/improve.py", "exec"), m.__dict__)
+    return m
+
+
+def measure(module, data, version, number, repeat):
+    def run():
+        module.apply(copy.deepcopy(data), version)
+    copies = min(timeit.repeat(lambda: copy.deepcopy(data), number=number, repeat=repeat))
+    return (min(timeit.repeat(run, number=number, repeat=repeat)) - copies) / number
+
+
+def main():
+    parser = argparse.ArgumentParser("improve.apply() benchmark")
+    parser.add_argument("--src", default="data/src", help="specs as downloaded by python -m slurmrest.improve get")
+    parser.add_argument("--ref", action="append", default=[], help="git revision to compare with")
+    parser.add_argument("--number", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    modules = {"worktree": improve}
+    for i in args.ref:
+        modules[i] = revision(i)
+
+    for i in sorted(Path(args.src).iterdir()):
+        data = json.loads(i.read_text())
+        for name, module in modules.items():
+            t = measure(module, data, i.stem, args.number, args.repeat)
+            print(f"{i.stem:12} {name:20} {t * 1000:10.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import argparse
+import time
+
+from slurmrest import export, fake, snapshot
+
+KEY = "c2VjcmV0"
+
+
+def measure(name, e, collect, number):
+    collect()
+    start = time.perf_counter()
+    for _ in range(number):
+        e.cycle(collect)
+    t = (time.perf_counter() - start) / number
+    print(f"{name:24} {t * 1000:10.3f} ms/cycle")
+
+
+def main():
+    parser = argparse.ArgumentParser("exporter throughput against the fake slurmrestd")
+    parser.add_argument("--scale", type=int, default=10000, help="nodes and jobs")
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--number", type=int, default=5)
+    args = parser.parse_args()
+
+    slurmrestd = fake.Slurmrestd(KEY, args.scale, args.latency)
+    url = slurmrestd.serve().url
+    key = b"secret"
+
+    e = export.Export()
+    client = export.connect("root", key, url, operations=export.OPERATIONS)
+    measure("sync", e, lambda: e.collect(client), args.number)
+
+    client = export.rawconnect("root", key, url, operations=export.OPERATIONS)
+    measure("sync raw", e, lambda: e.collect(client), args.number)
+
+    loop = export.Loop()
+    client = loop.run(export.aconnect("root", key, url, operations=export.ASYNC_OPERATIONS))
+    measure("async", e, lambda: loop.run(e.acollect(client)), args.number)
+
+    client = export.rawconnect("root", key, url, operations=export.ASYNC_OPERATIONS, asynchronous=True)
+    measure("async raw", e, lambda: loop.run(e.acollect(client)), args.number)
+
+    incremental = snapshot.Incremental(client, export.SNAPSHOTS)
+    measure("async raw incremental", e, lambda: loop.run(e.acollect(incremental)), args.number)
+
+
+if __name__ == "__main__":
+    main()
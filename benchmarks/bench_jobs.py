@@ -0,0 +1,46 @@
+import argparse
+import time
+import types
+
+from slurmrest import export, raw
+
+
+def jobs(n, partitions, accounts, users):
+    # records like raw.Client returns them for export.FIELDS
+    collection, fields = export.FIELDS["slurmctld_get_jobs"]
+    t = raw.record(collection, tuple(fields))
+    r = []
+    for i in range(n):
+        state = ["PENDING", "RUNNING", "RUNNING", "COMPLETING"][i % 4]
+        job = dict(job_id=i, job_state=state, partition=f"p{i % partitions}", account=f"a{i % accounts}",
+                   user_name=f"u{i % users}",
+                   state_reason=["Priority", "Resources", "Dependency"][i % 3] if state == "PENDING" else "None",
+                   tres_req_str=f"cpu={1 + i % 64},mem={1 + i % 16}G,node=1,billing={1 + i % 64}" +
+                                (f",gres/gpu={1 + i % 4}" if i % 5 == 0 else ""))
+        # whatever FIELDS has, the fields not set here are None
+        r.append(t._make(map(job.get, t._fields)))
+    return types.SimpleNamespace(errors=[], jobs=r)
+
+
+def main():
+    parser = argparse.ArgumentParser("Export.jobs() benchmark")
+    parser.add_argument("--jobs", type=int, default=200_000)
+    parser.add_argument("--partitions", type=int, default=20)
+    parser.add_argument("--accounts", type=int, default=300)
+    parser.add_argument("--users", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    r = jobs(args.jobs, args.partitions, args.accounts, args.users)
+    e = export.Export()
+    times = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        e.jobs(r)
+        times.append(time.perf_counter() - start)
+    # the first run parses the tres strings, later runs hit the cache
+    print(f"{args.jobs} jobs  first {times[0] * 1000:10.3f} ms  best {min(times) * 1000:10.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import time
+import types
+
+from bench_apply import revision
+from slurmrest import improve
+
+
+def jobs(n, nodes, cores):
+    # the shape slurmctld returns, allocated_nodes/cores/sockets as dicts with a dynamic index
+    r = []
+    for i in range(n):
+        allocated = {
+            str(k): {
+                "memory": 1024,
+                "cores": {str(c): "allocated" if c % 2 else "unallocated" for c in range(cores)},
+                "sockets": {"0": "assigned", "1": "unassigned"},
+            } for k in range(1 + i % nodes)
+        }
+        r.append({"job_id": i, "job_state": "RUNNING", "job_resources": {"nodes": "n[0-1]", "allocated_nodes": allocated}})
+    return {"meta": {}, "errors": [], "jobs": r}
+
+
+def normalizer(module):
+    if hasattr(module, "normalize"):
+        return module.normalize
+
+    # before normalize() was split from the plugin
+    def normalize(operationId, data):
+        module.OnMessage().parsed(types.SimpleNamespace(operationId=operationId, parsed=data))
+        return data
+    return normalize
+
+
+def measure(normalize, operationId, args):
+    best = None
+    for _ in range(args.repeat):
+        # rewritten in place, a fresh payload for each run
+        data = jobs(args.jobs, args.nodes, args.cores)
+        start = time.perf_counter()
+        normalize(operationId, data)
+        t = time.perf_counter() - start
+        best = t if best is None else min(best, t)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser("OnMessage payload rewrite benchmark")
+    parser.add_argument("--ref", action="append", default=[], help="git revision to compare with")
+    parser.add_argument("--jobs", type=int, default=100_000)
+    parser.add_argument("--nodes", type=int, default=2, help="allocated nodes per job, up to")
+    parser.add_argument("--cores", type=int, default=8, help="cores per allocated node")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    modules = {"worktree": improve}
+    for i in args.ref:
+        modules[i] = revision(i)
+
+    for name, module in modules.items():
+        normalize = normalizer(module)
+        for operationId in ["slurmctld_get_jobs", "slurmctld_get_nodes"]:
+            t = measure(normalize, operationId, args)
+            print(f"{operationId:20} {name:20} {t * 1000:10.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import argparse
+import os
+import tempfile
+import time
+
+from slurmrest import fake, improve
+
+KEY = "c2VjcmV0"
+
+
+def measure(name, get, number):
+    get()
+    start = time.perf_counter()
+    for _ in range(number):
+        get()
+    t = (time.perf_counter() - start) / number
+    print(f"{name:32} {t * 1000:8.3f} ms/request")
+
+
+def main():
+    parser = argparse.ArgumentParser("session factory benchmark")
+    parser.add_argument("--number", type=int, default=500)
+    args = parser.parse_args()
+
+    slurmrestd = fake.Slurmrestd(KEY)
+    tcp = slurmrestd.serve()
+    url = tcp.url.replace("/openapi.json", "/slurm/v0.0.37/ping")
+
+    uds = os.path.join(tempfile.mkdtemp(), "slurmrestd.socket")
+    slurmrestd.serve(uds=uds)
+
+    token = improve.Token(KEY, "root")
+
+    def new_client():
+        with improve.wget_factory("root", token) as s:
+            s.get(url)
+
+    measure("new client per request", new_client, args.number)
+
+    shared = improve.session_factory("root", token)
+    measure("session_factory (tcp)", lambda: shared().get(url), args.number)
+
+    shared = improve.session_factory("root", token, uds=uds)
+    measure("session_factory (uds)", lambda: shared().get("http://localhost/slurm/v0.0.37/ping"), args.number)
+
+
+if __name__ == "__main__":
+    main()
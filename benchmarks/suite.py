@@ -0,0 +1,119 @@
+import argparse
+import copy
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import types
+
+from aiopenapi3 import OpenAPI
+from prometheus_client import write_to_textfile
+
+from slurmrest import export, improve, raw, synthetic
+
+# the hot paths on synthetic payloads, e.g.
+#   python benchmarks/suite.py --scale 1000 10000 --output results.json
+# results are written as json, to compare them across revisions
+
+
+def timed(setup, run, repeat):
+    # setup is not timed, run gets its result - payloads which are modified in place are created again for each run
+    r = []
+    for _ in range(repeat):
+        value = setup()
+        start = time.perf_counter()
+        run(value)
+        r.append(time.perf_counter() - start)
+    return r
+
+
+def records(operationId, data):
+    # what raw.Client returns for export.FIELDS
+    collection, fields = export.FIELDS[operationId]
+    t = raw.record(collection, tuple(fields))
+    items = [t._make(map(i.get, fields)) for i in data[collection]]
+    return types.SimpleNamespace(errors=data["errors"], **{collection: items})
+
+
+def benchmarks(n, version):
+    # name → (setup, run)
+    spec = synthetic.spec(extra=n // 10)
+    plugin = improve.OnDocument(version)
+    message = improve.OnMessage()
+
+    api = OpenAPI("http://localhost/openapi.json", improve.patch(synthetic.spec(), version),
+                  session_factory=improve.session_factory())
+    nodes = improve.normalize("slurmctld_get_nodes", synthetic.response("slurmctld_get_nodes", n))
+    jobs = improve.normalize("slurmctld_get_jobs", synthetic.response("slurmctld_get_jobs", n))
+
+    e = export.Export()
+    outfile = os.path.join(tempfile.mkdtemp(), "slurmrest.prom")
+
+    def exported():
+        e.nodes(records("slurmctld_get_nodes", nodes))
+        e.jobs(records("slurmctld_get_jobs", jobs))
+
+    return {
+        "apply": (lambda: copy.deepcopy(spec), lambda s: (improve.apply(s, version), improve.apply(s, f"db{version}"))),
+        "OnDocument.parsed": (lambda: types.SimpleNamespace(document=copy.deepcopy(spec)), plugin.parsed),
+        "OnMessage.parsed(slurmctld_get_jobs)": (
+            lambda: types.SimpleNamespace(operationId="slurmctld_get_jobs",
+                                          parsed=synthetic.response("slurmctld_get_jobs", n)),
+            message.parsed),
+        "OnMessage.parsed(slurmdbd_get_users)": (
+            lambda: types.SimpleNamespace(operationId="slurmdbd_get_users",
+                                          parsed=synthetic.response("slurmdbd_get_users", n)),
+            message.parsed),
+        "model(nodes_response)": (lambda: nodes, api.components.schemas[f"{version}_nodes_response"].model),
+        "model(jobs_response)": (lambda: jobs, api.components.schemas[f"{version}_jobs_response"].model),
+        "Export.nodes": (lambda: records("slurmctld_get_nodes", nodes), e.nodes),
+        "Export.jobs": (lambda: records("slurmctld_get_jobs", jobs), e.jobs),
+        "write_to_textfile": (exported, lambda _: write_to_textfile(outfile, e.registry)),
+    }
+
+
+def revision():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, check=True,
+                              text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser("slurmrest benchmark suite")
+    parser.add_argument("--scale", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="nodes/jobs/users per payload, the description document has scale/10 additional paths")
+    parser.add_argument("--version", default="v0.0.37")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", action="append", default=[], help="run the benchmarks with this prefix only")
+    parser.add_argument("--output", "-o", default="benchmark-results.json")
+    args = parser.parse_args()
+
+    results = []
+    for n in args.scale:
+        for name, (setup, run) in benchmarks(n, args.version).items():
+            if args.only and not any(name.startswith(i) for i in args.only):
+                continue
+            runs = timed(setup, run, args.repeat)
+            results.append({"benchmark": name, "scale": n, "best": min(runs), "mean": statistics.mean(runs), "runs": runs})
+            print(f"{name:40} {n:8} {min(runs) * 1000:12.3f} ms")
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "revision": revision(),
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "version": args.version,
+            "repeat": args.repeat,
+            "results": results,
+        }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,21 @@
+import os
+
 import yaml
 import pytest
 #import openapi3
 from aiopenapi3 import OpenAPI
 
 from slurmrest import improve
+from slurmrest.cache import SpecCache
+
+# tests modifying slurmdbd run on one worker in file order with pytest -n auto --dist loadgroup,
+# everything else only reads and is distributed over the workers
+mutating = pytest.mark.xdist_group("slurmdbd")
 
 
 @pytest.fixture(scope="session")
 def token(config):
-    return improve.token(config["key"], config["user"])
+    return improve.Token(config["key"], config["user"])
 
 
 
@@ -21,28 +28,28 @@ def config():
 
 
 @pytest.fixture(scope="session")
-def client(config, token):
+def client(config, token, tmp_path_factory):
     user = config["user"]
     headers = {"User-Agent": f"aiopenapi3+slurmrest/0.1.0"}
-    import json, httpx
-    def wget_factory(*args, **kwargs) -> httpx.Client:
-        return improve.wget_factory(user, token, headers=headers)
-
-    api = OpenAPI.load_sync(config["url"], session_factory=wget_factory,
-                        plugins=[improve.OnDocument("v0.0.37"),
-                                 improve.OnMessage()])
-
-    def session_f(*args, **kwargs):
-        h = kwargs.get("headers", dict()).copy()
-        h.update(headers)
-        kwargs["headers"] = h
-        return httpx.Client(*args, **kwargs)
-    api.wget_factory = session_f
-    api.authenticate(user=user, token=token)
+    wget_factory = improve.session_factory(user, token, headers=headers, uds=config.get("uds"))
+
+    if (cache := config.get("cache")) is None and os.environ.get("PYTEST_XDIST_WORKER"):
+        # the base temp directory of the workers is shared, the first one fetches and patches the document
+        cache = {"path": tmp_path_factory.getbasetemp().parent / "slurmrest"}
+
+    if cache is None:
+        api = OpenAPI.load_sync(config["url"], session_factory=wget_factory,
+                            plugins=[improve.OnDocument("v0.0.37"),
+                                     improve.OnMessage()])
+    else:
+        cache = SpecCache(cache.get("path"), cache.get("max_age", 3600), cache.get("offline", False))
+        api = cache.load(config["url"], "v0.0.37", session_factory=wget_factory, plugins=[improve.OnMessage()])
+    api.authenticate(user=user, token=str(token))
     api.info.version = "dbv0.0.37"
     return api
 
 
+@mutating
 def test_slurmdbd_delete_account(client):
     test_slurmdbd_update_account(client)
     r = client._.slurmdbd_delete_account(parameters={"account_name":"unlimited"})
@@ -56,6 +63,7 @@ def test_slurmdbd_get_account(client):
     assert r.accounts[0].name == "root"
 
 
+@mutating
 def test_slurmdbd_update_account(client):
     update_account = client._.slurmdbd_update_account.data.get_type()
     account = update_account.__fields__["accounts"].type_
@@ -244,12 +252,14 @@ def test_slurmdbd_update_tres():
     raise NotImplementedError("slurmdbd_update_tres")
 
 
+@mutating
 def test_slurmdbd_delete_user(client):
     username = "c01teus"
     r = client._.slurmdbd_delete_user(parameters={"user_name":username})
     assert r.errors == []
 
 
+@mutating
 def test_slurmdbd_get_user(client):
     username = "c01teus"
     r = client._.slurmdbd_get_user(parameters={"user_name":username})
@@ -264,6 +274,7 @@ def test_slurmdbd_get_users(client):
     assert len(r.users) > 0
 
 
+@mutating
 def test_slurmdbd_update_users(client):
     username = "c01teus"
 
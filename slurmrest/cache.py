@@ -0,0 +1,400 @@
+import asyncio
+import collections
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    # not posix - the processes sharing the cache do not wait for each other, the results are the same
+    fcntl = None
+
+import httpx
+from aiopenapi3 import OpenAPI
+
+from slurmrest import improve, raw
+from slurmrest.util import atomic_write, sha256
+
+log = logging.getLogger(__name__)
+
+
+class SpecCache:
+    """
+    content addressed cache of the patched description documents
+
+    raw/<sha256>.json        the document as received from slurmrestd
+    patched/<key>.json       the result of improve.patch(), key is sha256(raw, version, operations, patchversion)
+    index/<sha256(url)>.json when the url was checked last and which raw document it returned
+
+    a document is only fetched again if the index entry is older than max_age, offline never fetches
+    if fetching it again fails (transport error or 5xx) the cached document is used, with a warning
+    fetching and patching hold lock/<sha256(url)>.lock - concurrent processes (e.g. pytest-xdist workers) sharing the
+    cache wait for the first one and use its result instead of fetching and patching the document themselves,
+    adocument() waits for the lock in a thread and for the other coroutines of the process with an asyncio.Lock
+    """
+
+    def __init__(self, path=None, max_age=3600, offline=False):
+        if path is None:
+            path = Path(os.environ.get("XDG_CACHE_HOME", "~/.cache")) / "slurmrest"
+        self.path = Path(path).expanduser()
+        self.max_age = max_age
+        self.offline = offline
+        # loop → url → asyncio.Lock
+        self._alocks = weakref.WeakKeyDictionary()
+
+    def key(self, raw, version, operations=None):
+        operations = "*" if operations is None else ",".join(sorted(operations))
+        return sha256("\0".join([raw, version, operations, improve.patchversion()]).encode())
+
+    def _index(self, url):
+        return self.path / "index" / f"{sha256(url.encode())}.json"
+
+    def _acquire(self, url):
+        p = self.path / "lock" / f"{sha256(url.encode())}.lock"
+        p.parent.mkdir(parents=True, exist_ok=True)
+        f = open(p, "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            except BaseException:
+                f.close()
+                raise
+        return f
+
+    def _release(self, f):
+        # closing the file releases the lock
+        f.close()
+
+    @contextlib.contextmanager
+    def lock(self, url):
+        f = self._acquire(url)
+        try:
+            yield
+        finally:
+            self._release(f)
+
+    @contextlib.asynccontextmanager
+    async def alock(self, url):
+        # the coroutines of the process wait for each other, the flock is only taken once per process and url
+        locks = self._alocks.setdefault(asyncio.get_running_loop(), dict())
+        async with locks.setdefault(url, asyncio.Lock()):
+            acquired = asyncio.get_running_loop().run_in_executor(None, self._acquire, url)
+            try:
+                f = await asyncio.shield(acquired)
+            except asyncio.CancelledError:
+                # the thread still gets the lock
+                acquired.add_done_callback(lambda i: i.cancelled() or i.exception() or self._release(i.result()))
+                raise
+            try:
+                yield
+            finally:
+                self._release(f)
+
+    def _entry(self, url):
+        try:
+            return json.loads(self._index(url).read_bytes())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _patched(self, raw, version, operations):
+        p = self.path / "patched" / f"{self.key(raw, version, operations)}.json"
+        try:
+            return json.loads(p.read_bytes())
+        except FileNotFoundError:
+            pass
+
+        try:
+            data = (self.path / "raw" / f"{raw}.json").read_bytes()
+        except FileNotFoundError:
+            return None
+
+        spec = improve.patch(json.loads(data), version, operations)
+        atomic_write(p, json.dumps(spec).encode())
+        return spec
+
+    def _cached(self, url, version, operations):
+        entry = self._entry(url)
+        if entry and (self.offline or time.time() - entry["checked"] < self.max_age):
+            if (spec := self._patched(entry["raw"], version, operations)) is not None:
+                return entry, spec
+
+        if self.offline:
+            raise FileNotFoundError(f"no cached description document for {url} in {self.path}")
+        return entry, None
+
+    def _conditional(self, entry):
+        # without the raw document a 304 would leave nothing to patch, it is fetched again unconditionally
+        headers = dict()
+        if entry and (self.path / "raw" / f"{entry['raw']}.json").exists():
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def _received(self, url, r, entry):
+        if r.status_code == 304 and entry:
+            raw = entry["raw"]
+        else:
+            r.raise_for_status()
+            raw = sha256(r.content)
+            if not (p := self.path / "raw" / f"{raw}.json").exists():
+                atomic_write(p, r.content)
+
+        entry = {
+            "url": url,
+            "raw": raw,
+            "checked": time.time(),
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+        }
+        atomic_write(self._index(url), json.dumps(entry).encode())
+        return entry
+
+    def _fallback(self, url, entry, version, operations, error):
+        # the cached document while slurmrestd does not answer, None if there is none
+        if isinstance(error, httpx.HTTPStatusError) and error.response.status_code < 500:
+            return None
+        if entry and (spec := self._patched(entry["raw"], version, operations)) is not None:
+            log.warning(f"{url}: fetching the description document failed, using the cached one: {error!r}")
+            return spec
+        return None
+
+    def document(self, url, version, session_factory=httpx.Client, operations=None):
+        entry, spec = self._cached(url, version, operations)
+        if spec is not None:
+            return spec
+
+        with self.lock(url):
+            # someone else may have fetched it while waiting
+            entry, spec = self._cached(url, version, operations)
+            if spec is not None:
+                return spec
+            try:
+                with session_factory() as session:
+                    r = session.get(url, headers=self._conditional(entry))
+                entry = self._received(url, r, entry)
+            except httpx.HTTPError as e:
+                if (spec := self._fallback(url, entry, version, operations, e)) is None:
+                    raise
+                return spec
+            return self._patched(entry["raw"], version, operations)
+
+    async def adocument(self, url, version, session_factory=httpx.AsyncClient, operations=None):
+        entry, spec = self._cached(url, version, operations)
+        if spec is not None:
+            return spec
+
+        async with self.alock(url):
+            entry, spec = self._cached(url, version, operations)
+            if spec is not None:
+                return spec
+            try:
+                async with session_factory() as session:
+                    r = await session.get(url, headers=self._conditional(entry))
+                entry = self._received(url, r, entry)
+            except httpx.HTTPError as e:
+                if (spec := self._fallback(url, entry, version, operations, e)) is None:
+                    raise
+                return spec
+            return self._patched(entry["raw"], version, operations)
+
+    def load(self, url, version, session_factory=httpx.Client, plugins=None, operations=None):
+        # the document is patched already - plugins must not contain OnDocument
+        spec = self.document(url, version, session_factory, operations)
+        return OpenAPI(url, spec, session_factory=session_factory, plugins=plugins)
+
+    async def aload(self, url, version, session_factory=httpx.AsyncClient, plugins=None, operations=None):
+        spec = await self.adocument(url, version, session_factory, operations)
+        return OpenAPI(url, spec, session_factory=session_factory, plugins=plugins)
+
+
+# seconds the responses of the operations changing rarely are kept by default
+TTLS = {
+    "slurmctld_get_partitions": 60,
+    "slurmctld_get_partition": 60,
+    "slurmdbd_get_qos": 300,
+    "slurmdbd_get_single_qos": 300,
+    "slurmdbd_get_tres": 300,
+    "slurmdbd_get_clusters": 300,
+    "slurmdbd_get_cluster": 300,
+    "slurmdbd_get_db_config": 300,
+}
+
+JOBS = ["slurmctld_get_jobs", "slurmctld_get_job"]
+USERS = ["slurmdbd_get_users", "slurmdbd_get_user"]
+ACCOUNTS = ["slurmdbd_get_accounts", "slurmdbd_get_account"]
+ASSOCIATIONS = ["slurmdbd_get_associations", "slurmdbd_get_association"]
+# the db config contains everything slurmdbd has
+CONFIG = ["slurmdbd_get_db_config"]
+
+# the responses each modifying operation invalidates, operations which are not listed invalidate nothing
+INVALIDATES = {
+    "slurmctld_submit_job": JOBS,
+    "slurmctld_cancel_job": JOBS,
+    "slurmctld_update_job": JOBS,
+    "slurmdbd_update_users": USERS + ACCOUNTS + ASSOCIATIONS + CONFIG,
+    "slurmdbd_update_account": ACCOUNTS + ASSOCIATIONS + CONFIG,
+    "slurmdbd_update_tres": ["slurmdbd_get_tres"] + CONFIG,
+    "slurmdbd_add_wckeys": ["slurmdbd_get_wckeys", "slurmdbd_get_wckey"] + CONFIG,
+    "slurmdbd_add_clusters": ["slurmdbd_get_clusters", "slurmdbd_get_cluster"] + CONFIG,
+    "slurmdbd_delete_user": USERS + ACCOUNTS + ASSOCIATIONS + CONFIG,
+    "slurmdbd_delete_account": USERS + ACCOUNTS + ASSOCIATIONS + CONFIG,
+    "slurmdbd_delete_association": USERS + ACCOUNTS + ASSOCIATIONS + CONFIG,
+    "slurmdbd_delete_qos": ["slurmdbd_get_qos", "slurmdbd_get_single_qos"] + ASSOCIATIONS + CONFIG,
+    "slurmdbd_delete_wckey": ["slurmdbd_get_wckeys", "slurmdbd_get_wckey"] + CONFIG,
+    "slurmdbd_delete_cluster": ["slurmdbd_get_clusters", "slurmdbd_get_cluster"] + USERS + ACCOUNTS + ASSOCIATIONS +
+                               CONFIG,
+    "slurmdbd_set_db_config": USERS + ACCOUNTS + ASSOCIATIONS + CONFIG +
+                              ["slurmdbd_get_qos", "slurmdbd_get_single_qos", "slurmdbd_get_tres", "slurmdbd_get_wckeys",
+                               "slurmdbd_get_wckey", "slurmdbd_get_clusters", "slurmdbd_get_cluster"],
+}
+
+
+class ResponseCache:
+    """
+    keeps the responses of an aiopenapi3 or raw client for the operations in ttls, e.g.
+
+        client = ResponseCache(client)
+        client._.slurmdbd_get_qos()   # slurmrestd
+        client._.slurmdbd_get_qos()   # cached for TTLS["slurmdbd_get_qos"] seconds
+        client.hits, client.misses
+
+    the key is the operationId and the parameters, at most maxsize responses are kept, the least recently used
+    ones are dropped first
+    calls of modifying operations (update, delete, …) drop the related responses, see INVALIDATES - a response
+    requested before is not kept when it arrives after the invalidation
+    the responses are shared between the callers - do not modify them
+    """
+
+    def __init__(self, client, ttls=TTLS, maxsize=256):
+        self.client = client
+        self.ttls = ttls
+        self.maxsize = maxsize
+        self.hits = collections.Counter()
+        self.misses = collections.Counter()
+        self.evicted = 0
+        self.invalidated = 0
+        self._entries = collections.OrderedDict()
+        # the invalidations of all and of each operationId, a response is only kept if there was none meanwhile
+        self._generation = 0
+        self._generations = collections.Counter()
+        self._lock = threading.Lock()
+        self._asynchronous = improve.asynchronous(client)
+        self._ = raw.Operations(self)
+
+    def __getattr__(self, item):
+        return getattr(self.client, item)
+
+    @property
+    def operations(self):
+        if isinstance(self.client, raw.Client):
+            return self.client.operations
+        # raw.Operations checks the name, the aiopenapi3 client knows its operations
+        return _Names(self.client)
+
+    def _call(self, operationId, parameters, data):
+        if isinstance(self.client, raw.Client):
+            return self.client.request(operationId, parameters, data)
+        kwargs = {k: v for k, v in (("parameters", parameters), ("data", data)) if v is not None}
+        return getattr(self.client._, operationId)(**kwargs)
+
+    def _key(self, operationId, parameters):
+        return operationId, json.dumps(parameters, sort_keys=True, default=str) if parameters else ""
+
+    def _get(self, key):
+        # the entry and None, or None and the generation to store the response with
+        with self._lock:
+            if (entry := self._entries.get(key)) is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses[key[0]] += 1
+                return None, self._current(key[0])
+            self._entries.move_to_end(key)
+            self.hits[key[0]] += 1
+            return entry, None
+
+    def _current(self, operationId):
+        return self._generation, self._generations[operationId]
+
+    def _put(self, key, r, generation):
+        with self._lock:
+            if self._current(key[0]) != generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttls[key[0]], r)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def invalidate(self, operationIds=None):
+        # drops the responses of operationIds, all with None
+        with self._lock:
+            if operationIds is None:
+                self._generation += 1
+            else:
+                self._generations.update(operationIds)
+            for key in list(self._entries):
+                if operationIds is None or key[0] in operationIds:
+                    del self._entries[key]
+                    self.invalidated += 1
+
+    def _modified(self, operationId):
+        if names := INVALIDATES.get(operationId):
+            self.invalidate(names)
+
+    def request(self, operationId, parameters=None, data=None):
+        if operationId not in self.ttls:
+            if self._asynchronous:
+                return self._amodify(operationId, parameters, data)
+            r = self._call(operationId, parameters, data)
+            self._modified(operationId)
+            return r
+
+        key = self._key(operationId, parameters)
+        entry, generation = self._get(key)
+        if entry is not None:
+            return self._ready(entry[1]) if self._asynchronous else entry[1]
+        if self._asynchronous:
+            return self._afetch(key, parameters, data, generation)
+        r = self._call(operationId, parameters, data)
+        self._store(key, r, generation)
+        return r
+
+    def _store(self, key, r, generation):
+        # responses with errors are not kept
+        if not getattr(r, "errors", None):
+            self._put(key, r, generation)
+
+    async def _ready(self, r):
+        return r
+
+    async def _afetch(self, key, parameters, data, generation):
+        r = await self._call(key[0], parameters, data)
+        self._store(key, r, generation)
+        return r
+
+    async def _amodify(self, operationId, parameters, data):
+        r = await self._call(operationId, parameters, data)
+        self._modified(operationId)
+        return r
+
+
+class _Names:
+    # the operationIds of an aiopenapi3 client for raw.Operations
+    def __init__(self, client):
+        self._client = client
+
+    def __contains__(self, item):
+        try:
+            getattr(self._client._, item)
+        except (AttributeError, KeyError):
+            return False
+        return True
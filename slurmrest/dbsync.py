@@ -0,0 +1,233 @@
+import argparse
+import base64
+import collections
+import json
+
+from slurmrest import export
+from slurmrest.cache import SpecCache
+
+OPERATIONS = ("slurmdbd_get_users", "slurmdbd_get_accounts", "slurmdbd_get_associations", "slurmdbd_update_users",
+              "slurmdbd_update_account", "slurmdbd_delete_user", "slurmdbd_delete_account",
+              "slurmdbd_delete_association")
+
+# never deleted
+PROTECTED = frozenset(["root"])
+
+
+def get(value, name, default=None):
+    # models, namespaces and dicts alike
+    if isinstance(value, dict):
+        return value.get(name, default)
+    return getattr(value, name, default)
+
+
+def checked(operationId, r):
+    if errors := get(r, "errors"):
+        raise ValueError(f"{operationId}: {'; '.join(str(get(i, 'error', i)) for i in errors)}")
+    return r
+
+
+class State:
+    """
+    the users and accounts of one cluster in slurmdbd, indexed
+
+        accounts       name → (description, organization) of the accounts with an association on the cluster
+        users          name → default account
+        associations   user → the accounts the user has an association with on the cluster (partition None)
+        other_users    the users with an association on another cluster
+        other_accounts the accounts with an association on another cluster, of the account or a user
+    """
+
+    def __init__(self, accounts=None, users=None, associations=None):
+        self.accounts = accounts or dict()
+        self.users = users or dict()
+        self.associations = associations or collections.defaultdict(set)
+        self.other_users = set()
+        self.other_accounts = set()
+
+    @classmethod
+    def fetch(cls, client, cluster):
+        # each collection is requested once
+        s = cls()
+        for a in checked("slurmdbd_get_associations", client._.slurmdbd_get_associations()).associations or []:
+            if get(a, "cluster") != cluster:
+                if user := get(a, "user"):
+                    s.other_users.add(user)
+                s.other_accounts.add(get(a, "account"))
+                continue
+            if get(a, "partition"):
+                continue
+            if user := get(a, "user"):
+                s.associations[user].add(get(a, "account"))
+            else:
+                s.accounts[get(a, "account")] = None
+
+        for a in checked("slurmdbd_get_accounts", client._.slurmdbd_get_accounts()).accounts or []:
+            if (name := get(a, "name")) in s.accounts or \
+                    any(get(i, "cluster") == cluster and not get(i, "user") for i in get(a, "associations") or []):
+                s.accounts[name] = (get(a, "description"), get(a, "organization"))
+
+        for u in checked("slurmdbd_get_users", client._.slurmdbd_get_users()).users or []:
+            if (name := get(u, "name")) in s.associations:
+                s.users[name] = get(get(u, "default"), "account")
+        return s
+
+    @classmethod
+    def desired(cls, accounts, users):
+        """
+        accounts: name → {"description": …, "organization": …}
+        users: name → [account, …], the first one is the default account
+        """
+        s = cls()
+        for name, a in accounts.items():
+            s.accounts[name] = (a.get("description", name), a.get("organization", name))
+        for name, a in users.items():
+            s.users[name] = a[0]
+            s.associations[name] = set(a)
+        return s
+
+
+class Plan:
+    """
+    the changes turning current into desired
+    only what differs is sent - new or changed accounts, users with a new default or new associations
+
+    with prune, what is not desired is removed from the cluster - the associations of users and accounts which
+    have associations on other clusters too, all others are deleted from slurmdbd
+    associations of desired users which are not desired are reported in stale, and removed with prune
+    """
+
+    def __init__(self, current, desired, cluster, prune=False):
+        self.cluster = cluster
+        self.accounts = {name: v for name, v in desired.accounts.items() if current.accounts.get(name) != v}
+        self.users = dict()
+        for name, default in desired.users.items():
+            new = desired.associations[name] - current.associations.get(name, set())
+            if new or current.users.get(name) != default:
+                self.users[name] = (default, sorted(new))
+        self.stale = {name: sorted(current.associations[name] - accounts) for name, accounts in desired.associations.items()
+                      if current.associations.get(name, set()) - accounts}
+
+        # the query parameters of slurmdbd_delete_association
+        self.delete_associations = []
+        self.delete_users = []
+        self.delete_accounts = []
+        if prune:
+            for name in sorted(current.associations.keys() - desired.users.keys() - PROTECTED):
+                if name in current.other_users:
+                    self.delete_associations.append({"cluster": cluster, "user": name})
+                else:
+                    self.delete_users.append(name)
+            # removing an account from the cluster removes the associations of its users there too
+            removed = current.accounts.keys() - desired.accounts.keys() - PROTECTED
+            for name, accounts in sorted(self.stale.items()):
+                self.delete_associations.extend({"cluster": cluster, "user": name, "account": a} for a in accounts
+                                                if a not in removed)
+            for name in sorted(removed):
+                if name in current.other_accounts:
+                    self.delete_associations.append({"cluster": cluster, "account": name})
+                else:
+                    self.delete_accounts.append(name)
+        self.unchanged = {"accounts": len(desired.accounts) - len(self.accounts),
+                          "users": len(desired.users) - len(self.users)}
+
+    def account(self, name):
+        description, organization = self.accounts[name]
+        return {"name": name, "description": description, "organization": organization, "coordinators": [],
+                "flags": [], "associations": [{"account": name, "cluster": self.cluster, "partition": None, "user": None}]}
+
+    def user(self, name):
+        default, accounts = self.users[name]
+        return {"name": name, "default": {"account": default}, "coordinators": [],
+                "associations": [{"account": a, "cluster": self.cluster, "partition": None, "user": name}
+                                 for a in accounts]}
+
+    def counts(self):
+        return {"accounts": len(self.accounts), "users": len(self.users), "delete_users": len(self.delete_users),
+                "delete_accounts": len(self.delete_accounts), "delete_associations": len(self.delete_associations),
+                "stale": sum(map(len, self.stale.values())),
+                **{f"unchanged_{k}": v for k, v in self.unchanged.items()}}
+
+
+def chunks(values, size):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def apply(client, plan, chunk=500):
+    """
+    sends the plan - accounts first, the users may need them, then the associations, users and accounts are deleted
+    returns the counts of what was sent and the errors, a failing chunk does not stop the others
+    """
+    done = collections.Counter()
+    errors = []
+
+    def call(kind, n, operationId, **kwargs):
+        try:
+            checked(operationId, getattr(client._, operationId)(**kwargs))
+            done[kind] += n
+        except Exception as e:
+            errors.append((operationId, kwargs.get("parameters"), e))
+
+    for names in chunks(plan.accounts, chunk):
+        call("accounts", len(names), "slurmdbd_update_account", data={"accounts": [plan.account(i) for i in names]})
+    for names in chunks(plan.users, chunk):
+        call("users", len(names), "slurmdbd_update_users", data={"users": [plan.user(i) for i in names]})
+    for parameters in plan.delete_associations:
+        call("delete_associations", 1, "slurmdbd_delete_association", parameters=parameters)
+    for name in plan.delete_users:
+        call("delete_users", 1, "slurmdbd_delete_user", parameters={"user_name": name})
+    for name in plan.delete_accounts:
+        call("delete_accounts", 1, "slurmdbd_delete_account", parameters={"account_name": name})
+    return dict(done), errors
+
+
+def sync(client, cluster, accounts, users, prune=False, chunk=500, dry_run=False):
+    # fetch, diff and send, see State.desired for accounts and users
+    plan = Plan(State.fetch(client, cluster), State.desired(accounts, users), cluster, prune)
+    if dry_run:
+        return plan, dict(), []
+    return (plan, *apply(client, plan, chunk))
+
+
+def main():
+    parser = argparse.ArgumentParser("sync slurmdbd users and accounts with a desired state")
+    parser.add_argument("desired", help="yaml with accounts: {name: {description, organization}} and "
+                                        "users: {name: [default account, other accounts…]}")
+    parser.add_argument("--cluster", required=True)
+    parser.add_argument("--user", "-u", default="root")
+    parser.add_argument("--jwt-key-file", "-j", default="/etc/slurm/jwt_hs256.key")
+    parser.add_argument("--jwt-key", "-J")
+    parser.add_argument("--url", "-U", default="http://127.0.0.1:6820/openapi.json")
+    parser.add_argument("--cache-dir", default=None, help="patched description document cache, default ~/.cache/slurmrest")
+    parser.add_argument("--raw", "-r", action="store_true", help="skip model validation")
+    parser.add_argument("--prune", action="store_true", help="remove users, accounts and associations which are not desired from the cluster")
+    parser.add_argument("--chunk", type=int, default=500, help="users/accounts per update call")
+    parser.add_argument("--dry-run", "-n", action="store_true", help="print the counts, change nothing")
+    args = parser.parse_args()
+
+    import yaml
+
+    with open(args.desired) as f:
+        desired = yaml.safe_load(f)
+
+    if args.jwt_key:
+        key = base64.b64decode(args.jwt_key)
+    else:
+        with open(args.jwt_key_file, "rb") as f:
+            key = f.read()
+
+    connect = export.rawconnect if args.raw else export.connect
+    client = connect(args.user, key, args.url, SpecCache(args.cache_dir), OPERATIONS)
+    plan, done, errors = sync(client, args.cluster, desired.get("accounts") or dict(), desired.get("users") or dict(),
+                              args.prune, args.chunk, args.dry_run)
+    print(json.dumps({"plan": plan.counts(), "sent": done, "errors": len(errors)}))
+    for operationId, parameters, e in errors:
+        print(f"{operationId} {parameters or ''}: {e}")
+    if errors:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
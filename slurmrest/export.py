@@ -1,65 +1,616 @@
 import argparse
-import collections
-import re
+import asyncio
+import copy
+import functools
+import logging
+import math
+import random
 import base64
+import threading
+import time
 
+import numpy
 from aiopenapi3 import OpenAPI
-from prometheus_client import CollectorRegistry, Gauge, write_to_textfile
-from prometheus_client import Enum
+from prometheus_client import CollectorRegistry, Gauge, start_http_server, write_to_textfile
+from prometheus_client import Counter
+from prometheus_client.core import GaugeMetricFamily, Metric, StateSetMetricFamily
+from prometheus_client.samples import Sample
 
-from slurmrest import improve
+from slurmrest import improve, raw, snapshot, tres
+from slurmrest.cache import SpecCache
+
+log = logging.getLogger(__name__)
 
 improve.OnDocument._root = None
 improve.OnMessage._root = None
 
-def client(user, url, token):
-    headers = {"User-Agent": f"aiopenapi3+slurmrest/0.1.0"}
-    import json, httpx
-    def wget_factory(*args, **kwargs) -> httpx.Client:
-        return improve.wget_factory(user, token, headers=headers)
-
-    api = OpenAPI.load_sync(url, session_factory=wget_factory,
-                        plugins=[improve.OnDocument("v0.0.37"),
-                                 improve.OnMessage()]
-    )
-
-    def session_f(*args, **kwargs):
-        h = kwargs.get("headers", dict()).copy()
-        h.update(headers)
-        kwargs["headers"] = h
-        return httpx.Client(*args, **kwargs)
-    api.wget_factory = session_f
-    api.authenticate(user=user, token=token)
+# the operations used by the exporter, everything else is pruned from the description document
+OPERATIONS = ("slurmctld_get_nodes",)
+ASYNC_OPERATIONS = ("slurmctld_get_nodes", "slurmctld_get_jobs", "slurmctld_get_partitions", "slurmctld_diag")
+
+# the fields the exporter reads, a raw client returns records of these instead of models
+FIELDS = {
+    "slurmctld_get_nodes": ("nodes", ("name", "state", "state_flags", "tres", "tres_used")),
+    "slurmctld_get_jobs": ("jobs", ("job_id", "job_state", "partition", "account", "user_name", "state_reason", "tres_req_str")),
+}
+
+# collection and key of the operations polled incrementally
+SNAPSHOTS = {
+    "slurmctld_get_nodes": ("nodes", "name"),
+    "slurmctld_get_jobs": ("jobs", "job_id"),
+}
+
+GPU = "^gres/((?P<model>[^\+])/)?gpu"
+
+HEADERS = {"User-Agent": f"aiopenapi3+slurmrest/0.1.0"}
+
+def client(user, url, token, cache=None, operations=None, **kwargs):
+    # kwargs are passed to improve.session_factory - timeout, http2, uds …
+    wget_factory = improve.session_factory(user, token, headers=HEADERS, **kwargs)
+
+    if cache is None:
+        api = OpenAPI.load_sync(url, session_factory=wget_factory,
+                            plugins=[improve.OnDocument("v0.0.37", operations),
+                                     improve.OnMessage()]
+        )
+    else:
+        api = cache.load(url, "v0.0.37", session_factory=wget_factory, plugins=[improve.OnMessage()],
+                         operations=operations)
+
+    # a Token sets the current token on each request, this only satisfies the security requirements
+    api.authenticate(user=user, token=str(token))
     api.info.version = "dbv0.0.37"
     return api
 
 
-def connect(user, key, url):
-    token = improve.token(base64.b64encode(key), user)
-    return client(user, url, token)
+def rawclient(user, url, token, cache=None, operations=None, asynchronous=False, **kwargs):
+    wget_factory = improve.session_factory(user, token, headers=HEADERS, **kwargs)
+    try:
+        if cache is None:
+            document = improve.document(url, "v0.0.37", wget_factory, operations)
+        else:
+            document = cache.document(url, "v0.0.37", wget_factory, operations)
+    finally:
+        if asynchronous:
+            # the pooled sync session only fetches the document then
+            wget_factory.client.close()
+
+    if asynchronous:
+        wget_factory = improve.session_factory(user, token, headers=HEADERS, asynchronous=True, **kwargs)
+        return raw.AsyncClient(url, document, wget_factory, FIELDS)
+    return raw.Client(url, document, wget_factory, FIELDS)
+
+
+def connect(user, key, url, cache=None, operations=None, lifetime=600, skew=60, **kwargs):
+    token = improve.Token(base64.b64encode(key), user, lifetime, skew)
+    return client(user, url, token, cache, operations, **kwargs)
+
+
+def rawconnect(user, key, url, cache=None, operations=None, lifetime=600, skew=60, **kwargs):
+    token = improve.Token(base64.b64encode(key), user, lifetime, skew)
+    return rawclient(user, url, token, cache, operations, **kwargs)
+
+
+async def aclient(user, url, token, cache=None, operations=None, **kwargs):
+    wget_factory = improve.session_factory(user, token, headers=HEADERS, asynchronous=True, **kwargs)
+
+    if cache is None:
+        api = await OpenAPI.load_async(url, session_factory=wget_factory,
+                                       plugins=[improve.OnDocument("v0.0.37", operations),
+                                                improve.OnMessage()])
+    else:
+        api = await cache.aload(url, "v0.0.37", session_factory=wget_factory, plugins=[improve.OnMessage()],
+                                operations=operations)
+    api.authenticate(user=user, token=str(token))
+    return api
+
+
+async def aconnect(user, key, url, cache=None, operations=None, lifetime=600, skew=60, **kwargs):
+    token = improve.Token(base64.b64encode(key), user, lifetime, skew)
+    return await aclient(user, url, token, cache, operations, **kwargs)
+
+
+class Loop:
+    # an event loop in a background thread, for the synchronous parts of the exporter
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
 
 
 class Resource:
-    def __init__(self, name, registry):
-        self.used = Gauge(f'slurmctld_{name}_used_count', f'{name} allocation tracking', labelnames=["node"], registry=registry)
-        self.total = Gauge(f'slurmctld_{name}_total_count', f'{name} resource tracking', labelnames=["node"], registry=registry)
+    def __init__(self, name):
+        self.name = name
+
+    def families(self):
+        return (GaugeMetricFamily(f'slurmctld_{self.name}_used_count', f'{self.name} allocation tracking', labels=["node"]),
+                GaugeMetricFamily(f'slurmctld_{self.name}_total_count', f'{self.name} resource tracking', labels=["node"]))
+
+
+class Nodes:
+    # a custom collector for the node metrics, the families are built from the nodes in one pass by Export.nodes
+    # and replaced as a whole - nodes which are gone disappear, nothing accumulates per label
+    def __init__(self, registry):
+        self.families = []
+        registry.register(self)
+
+    def collect(self):
+        return self.families
+
+
+class Queue:
+    # jobs by state and one other label
+    def __init__(self, label, attribute, registry):
+        self.label = label
+        self.attribute = attribute
+        self.jobs = Gauge(f'slurmctld_{label}_jobs_count', f'jobs by {label} and state',
+                          labelnames=[label, "state"], registry=registry)
+        self.cpus = Gauge(f'slurmctld_{label}_jobs_cpus_count', f'cpus requested by the jobs by {label} and state',
+                          labelnames=[label, "state"], registry=registry)
+        self.gpus = Gauge(f'slurmctld_{label}_jobs_gpus_count', f'gpus requested by the jobs by {label} and state',
+                          labelnames=[label, "state"], registry=registry)
+
+    def clear(self):
+        self.jobs.clear()
+        self.cpus.clear()
+        self.gpus.clear()
+
+
+def encode(values):
+    # dictionary encoding of a column - the codes and the distinct values
+    index = dict()
+    codes = numpy.fromiter((index.setdefault(i or "", len(index)) for i in values), dtype=numpy.int64, count=len(values))
+    return codes, list(index)
+
+
+def rollup(columns, *weights):
+    # group by the combination of the encoded columns
+    # the label values of each group, the number of rows and the sum of each weight per group
+    key = numpy.zeros(len(columns[0][0]), dtype=numpy.int64)
+    for codes, names in columns:
+        key = key * len(names) + codes
+    groups, inverse = numpy.unique(key, return_inverse=True)
+    counts = numpy.bincount(inverse, minlength=len(groups))
+    sums = [numpy.bincount(inverse, weights=w, minlength=len(groups)) for w in weights]
+
+    labels = []
+    for g in groups.tolist():
+        r = []
+        for codes, names in reversed(columns):
+            g, c = divmod(g, len(names))
+            r.append(names[c])
+        labels.append(tuple(reversed(r)))
+    return labels, counts.tolist(), [i.tolist() for i in sums]
 
 
 class Export:
     # https://slurm.schedmd.com/sinfo.html#OPT_STATE
     STATES = "allocated, completing, down, drained, draining, fail, failing, future, idle, maint, mixed, perfctrs, planned, power_down, power_up, reserved, unknown".split(", ")
 
-    def __init__(self):
+    # slurmctld_diag statistics
+    DIAG = ["server_thread_count", "agent_queue_size", "agent_count", "dbd_agent_queue_size",
+            "schedule_cycle_last", "schedule_cycle_mean", "schedule_queue_length",
+            "jobs_submitted", "jobs_started", "jobs_completed", "jobs_canceled", "jobs_failed",
+            "jobs_pending", "jobs_running", "bf_cycle_last", "bf_queue_len"]
+
+    def __init__(self, name=None):
+        # name prefixes the log messages
+        self.name = name
         self.registry = registry = CollectorRegistry()
-        self.state_value = Gauge('slurmctld_node_state_value', 'the state of the node', labelnames=["node"],
-                                 registry=registry)
-        self.state_name = Enum('slurmctld_node_state_name', 'the state of the node', labelnames=["node"],
-                               states=self.STATES, registry=registry)
+        self.node_metrics = Nodes(registry)
 
         self.values = {
-            "^gres/((?P<model>[^\+])/)?gpu": Resource("gpu", registry),
-            "^cpu": Resource("cpu", registry)
+            GPU: Resource("gpu"),
+            "^cpu": Resource("cpu")
         }
+        self.matcher = tres.Matcher(self.values)
+
+        self.job_states = Gauge('slurmctld_jobs_state_count', 'number of jobs in the state', labelnames=["state"],
+                                registry=registry)
+        self.queues = [Queue("partition", "partition", registry), Queue("account", "account", registry),
+                       Queue("user", "user_name", registry)]
+        self.pending_reasons = Gauge('slurmctld_jobs_pending_reason_count', 'pending jobs by partition and reason',
+                                     labelnames=["partition", "reason"], registry=registry)
+        # cpus and gpus requested by a job
+        self.requested = tres.Matcher(["^cpu", GPU])
+        self.partition_nodes = Gauge('slurmctld_partition_nodes_total_count', 'nodes of the partition',
+                                     labelnames=["partition"], registry=registry)
+        self.partition_cpus = Gauge('slurmctld_partition_cpus_total_count', 'cpus of the partition',
+                                    labelnames=["partition"], registry=registry)
+        self.statistics = Gauge('slurmctld_diag_statistic', 'slurmctld statistics (sdiag)', labelnames=["name"],
+                                registry=registry)
+
+        self.call_success = Gauge('slurmrest_exporter_call_success', 'whether the last call succeeded',
+                                  labelnames=["operation"], registry=registry)
+        self.call_duration = Gauge('slurmrest_exporter_call_duration_seconds', 'time the last call took',
+                                   labelnames=["operation"], registry=registry)
+        # registered by scheduled(), a single collection has no cycles
+        self.duration = Gauge('slurmrest_exporter_cycle_duration_seconds', 'time it took to collect the metrics',
+                              registry=None)
+        self.overruns = Counter('slurmrest_exporter_cycle_overruns', 'collections which did not finish within the interval',
+                                registry=None)
+        self.failures = Counter('slurmrest_exporter_cycle_failures', 'collections which failed', registry=None)
+
+        # the responses exported last, a snapshot.Incremental returns the same response while nothing changed
+        self.processed = dict()
+
+    def process(self, client, name, r, f):
+        if r is self.processed.get(name):
+            return
+        f(r)
+        if isinstance(client, snapshot.Incremental):
+            self.processed[name] = r
+
+    def collect(self, client):
+        r = client._.slurmctld_get_nodes()
+        self.process(client, "slurmctld_get_nodes", r, self.nodes)
+
+    async def acollect(self, client, timeout=10):
+        # all calls at once, a failing call does not prevent the others from being exported
+        async def call(name):
+            start = time.monotonic()
+            try:
+                return await asyncio.wait_for(getattr(client._, name)(), timeout)
+            finally:
+                self.call_duration.labels(name).set(time.monotonic() - start)
+
+        results = await asyncio.gather(*[call(i) for i in ASYNC_OPERATIONS], return_exceptions=True)
+
+        process = {
+            "slurmctld_get_nodes": self.nodes,
+            "slurmctld_get_jobs": self.jobs,
+            "slurmctld_get_partitions": self.partitions,
+            "slurmctld_diag": self.diag,
+        }
+        failed = []
+        for name, r in zip(ASYNC_OPERATIONS, results):
+            try:
+                if isinstance(r, BaseException):
+                    raise r
+                self.process(client, name, r, process[name])
+            except Exception as e:
+                self.call_success.labels(name).set(0)
+                failed.append(f"{name}: {e!r}")
+            else:
+                self.call_success.labels(name).set(1)
+
+        if failed:
+            raise RuntimeError("; ".join(failed))
+
+    def jobs(self, r):
+        assert r.errors == []
+        # the fields as columns, aggregated per group instead of per job
+        jobs = r.jobs
+        columns = {name: encode([getattr(i, name) for i in jobs])
+                   for name in ["job_state", "partition", "account", "user_name", "state_reason"]}
+        requested = numpy.array([self.requested.vector(i.tres_req_str or "") for i in jobs], dtype=float)
+        requested = numpy.nan_to_num(requested.reshape(len(jobs), 2))
+        cpus, gpus = requested[:, 0], requested[:, 1]
+        state = columns["job_state"]
+
+        self.job_states.clear()
+        for (s,), n in zip(*rollup([state])[:2]):
+            self.job_states.labels(s).set(n)
+
+        for queue in self.queues:
+            queue.clear()
+            labels, counts, (c, g) = rollup([columns[queue.attribute], state], cpus, gpus)
+            for (name, s), n, c_, g_ in zip(labels, counts, c, g):
+                queue.jobs.labels(name, s).set(n)
+                queue.cpus.labels(name, s).set(c_)
+                queue.gpus.labels(name, s).set(g_)
+
+        self.pending_reasons.clear()
+        if "PENDING" in state[1]:
+            pending = state[0] == state[1].index("PENDING")
+            labels, counts, _ = rollup([(codes[pending], names) for codes, names in
+                                        [columns["partition"], columns["state_reason"]]])
+            for (partition, reason), n in zip(labels, counts):
+                self.pending_reasons.labels(partition, reason).set(n)
+
+    def partitions(self, r):
+        assert r.errors == []
+        self.partition_nodes.clear()
+        self.partition_cpus.clear()
+        for i in r.partitions:
+            self.partition_nodes.labels(i.name).set(i.total_nodes)
+            self.partition_cpus.labels(i.name).set(i.total_cpus)
+
+    def diag(self, r):
+        assert r.errors == []
+        for name in self.DIAG:
+            if (value := getattr(r.statistics, name, None)) is not None:
+                self.statistics.labels(name).set(value)
+
+    def nodes(self, r):
+        assert r.errors == []
+
+        state_value = GaugeMetricFamily('slurmctld_node_state_value', 'the state of the node', labels=["node"])
+        state_name = StateSetMetricFamily('slurmctld_node_state_name', 'the state of the node', labels=["node"])
+        resources = [i.families() for i in self.values.values()]
+
+        for i in r.nodes:
+            s = i.state
+            if "DRAIN" in i.state_flags:
+                if i.state == "idle":
+                    s = "drained"
+                else:
+                    s = "draining"
+
+            state_value.add_metric([i.name], Export.STATES.index(s))
+            # like add_metric, without a dict and sorting per node - STATES are sorted
+            state_name.samples.extend(Sample(state_name.name, {"node": i.name, state_name.name: k}, int(k == s))
+                                      for k in Export.STATES)
+
+            if s not in {"idle","mixed"}:
+                continue
+
+            for value, n in [(i.tres_used, 0), (i.tres, 1)]:
+                if value is None:
+                    continue
+                for families, v in zip(resources, self.matcher.vector(value)):
+                    if v is not None:
+                        families[n].add_metric([i.name], v)
+
+        self.node_metrics.families = [state_value, state_name] + [f for i in resources for f in i]
+
+    def scheduled(self):
+        for i in (self.duration, self.overruns, self.failures):
+            self.registry.register(i)
+
+    def _finished(self, start, error=None):
+        # the duration and whether collecting succeeded
+        if error is not None:
+            self.failures.inc()
+            log.error(f"{self.name + ': ' if self.name else ''}collecting the metrics failed", exc_info=error)
+        self.duration.set(duration := time.monotonic() - start)
+        return duration, error is None
+
+    def cycle(self, collect):
+        start = time.monotonic()
+        try:
+            collect()
+        except Exception as e:
+            return self._finished(start, e)
+        return self._finished(start)
+
+    async def acycle(self, collect):
+        # cycle() for a coroutine function
+        start = time.monotonic()
+        try:
+            await collect()
+        except Exception as e:
+            return self._finished(start, e)
+        return self._finished(start)
+
+
+class Collector:
+    # serves the metrics of the last collection and collects again once they are older than max_age
+    # concurrent scrapes wait for the collection in progress instead of starting their own
+    def __init__(self, refresh, registry, max_age):
+        self.refresh = refresh
+        self.registry = registry
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._updated = None
+        self._families = []
+
+    def collect(self):
+        with self._lock:
+            if self._updated is None or time.monotonic() - self._updated >= self.max_age:
+                self.refresh()
+                self._families = list(self.registry.collect())
+                self._updated = time.monotonic()
+            return self._families
+
+
+class Cluster:
+    def __init__(self, name, connect):
+        self.name = name
+        # a coroutine function returning the client, called by Clusters until it succeeded
+        self.connect = connect
+        self.client = None
+        self.export = Export(name)
+        self.task = None
+
+
+def clusters(config, cache=None, operations=ASYNC_OPERATIONS, lifetime=600, skew=60, use_raw=True, snapshots=None,
+             **kwargs):
+    # config as loaded from the --clusters file, the clusters share one patched document per version
+    # the clients are asynchronous, raw.AsyncClient or aiopenapi3 validating the models without use_raw,
+    # a snapshot.Incremental for the operations in snapshots
+    documents = dict()
+
+    async def connect(url, version, user, token, kw):
+        wget_factory = improve.session_factory(user, token, headers=HEADERS, asynchronous=True, **kw)
+        try:
+            # another cluster with the same version may have provided it
+            if (document := documents.get(version)) is None:
+                if cache is None:
+                    document = await improve.adocument(url, version, wget_factory, operations)
+                else:
+                    document = await cache.adocument(url, version, wget_factory, operations)
+                documents[version] = document
+        except BaseException:
+            await wget_factory.client.aclose()
+            raise
+
+        if use_raw:
+            client = raw.AsyncClient(url, document, wget_factory, FIELDS)
+        else:
+            client = OpenAPI(url, copy.deepcopy(document), session_factory=wget_factory, plugins=[improve.OnMessage()])
+            client.authenticate(user=user, token=str(token))
+        if snapshots:
+            client = snapshot.Incremental(client, snapshots)
+        return client
+
+    r = []
+    for name, c in config["clusters"].items():
+        if c.get("key"):
+            key = base64.b64decode(c["key"])
+        else:
+            with open(c.get("key_file", "/etc/slurm/jwt_hs256.key"), "rb") as f:
+                key = f.read()
+        user = c.get("user", "root")
+        token = improve.Token(base64.b64encode(key), user, lifetime, skew)
+        r.append(Cluster(name, functools.partial(connect, c["url"], c.get("version", "v0.0.37"), user, token,
+                                                 {**kwargs, **{k: c[k] for k in ["uds", "http2"] if k in c}})))
+    return r
+
+
+class Clusters:
+    """
+    the Export of each cluster, collected concurrently and served with a cluster label
+
+    at most concurrency clusters are collected at once, a cycle waits up to timeout for them -
+    a cluster which takes longer keeps collecting in the background and is not started again until it is done,
+    meanwhile its last metrics are served
+    the description document of a cluster is loaded by its first cycle, if that fails (or takes longer than timeout)
+    the cluster is left out and tried again with the next cycle, slurmrest_exporter_up is 0 meanwhile
+    """
+
+    # the schedule is shared by the clusters
+    SHARED = {"slurmrest_exporter_cycle_overruns"}
+
+    def __init__(self, clusters, timeout=10, concurrency=4):
+        self.clusters = clusters
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.registry = CollectorRegistry()
+        self.registry.register(self)
+        self.overruns = Counter('slurmrest_exporter_cycle_overruns', 'collections which did not finish within the interval',
+                                registry=None)
+        self.up = Gauge('slurmrest_exporter_up', 'whether the last collection of the cluster succeeded',
+                        labelnames=["cluster"], registry=self.registry)
+        for c in clusters:
+            self.up.labels(c.name).set(0)
+        self._semaphore = None
+
+    def collect(self):
+        families = dict()
+        for c in self.clusters:
+            for f in c.export.registry.collect():
+                if f.name in self.SHARED:
+                    continue
+                if (family := families.get(f.name)) is None:
+                    family = families[f.name] = Metric(f.name, f.documentation, f.type, f.unit)
+                family.samples.extend(s._replace(labels={"cluster": c.name, **s.labels}) for s in f.samples)
+        return list(families.values())
+
+    def scheduled(self):
+        self.registry.register(self.overruns)
+        for c in self.clusters:
+            c.export.scheduled()
+
+    async def _collect(self, c):
+        async with self._semaphore:
+            if c.client is None:
+                try:
+                    c.client = await asyncio.wait_for(c.connect(), self.timeout)
+                except Exception:
+                    log.exception(f"{c.name}: loading the description document failed, trying again next cycle")
+                    return False
+            duration, ok = await c.export.acycle(lambda: c.export.acollect(c.client, self.timeout))
+            return ok
+
+    async def acollect(self):
+        # whether any cluster was collected, those which failed or are still running keep their last metrics
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        for c in self.clusters:
+            if c.task is None or c.task.done():
+                c.task = asyncio.ensure_future(self._collect(c))
+        await asyncio.wait([c.task for c in self.clusters], timeout=self.timeout)
+        for c in self.clusters:
+            if c.task.done():
+                self.up.labels(c.name).set(int(c.task.result()))
+        return any(c.task.done() and c.task.result() for c in self.clusters)
+
+    def cycle(self, collect):
+        start = time.monotonic()
+        ok = collect()
+        return time.monotonic() - start, ok
+
+
+def serve(e, collect, listen, max_age):
+    def refresh():
+        e.cycle(collect)
+
+    registry = CollectorRegistry()
+    registry.register(Collector(refresh, e.registry, max_age))
+
+    # port, addr:port or [ipv6]:port
+    addr, _, port = listen.rpartition(":")
+    start_http_server(int(port), addr.strip("[]") or "0.0.0.0", registry=registry)
+    threading.Event().wait()
+
+
+def daemon(e, collect, outfile, interval, jitter=0):
+    # cycles are scheduled on a fixed grid (start + n * interval) so they do not drift,
+    # the grid is offset by a random jitter to spread many exporters over the interval
+    start = time.monotonic() + random.uniform(0, jitter)
+    n = 0
+    while True:
+        if (delay := start + n * interval - time.monotonic()) > 0:
+            time.sleep(delay)
+
+        duration, ok = e.cycle(collect)
+        if ok:
+            write_to_textfile(outfile, e.registry)
+        else:
+            # the outfile keeps its age instead of being refreshed with the gauges of the last cycle
+            log.warning(f"nothing collected, {outfile} is not updated")
+
+        # skip the slots which passed while collecting
+        slot = max(n + 1, math.ceil((time.monotonic() - start) / interval))
+        if (missed := slot - n - 1) > 0:
+            e.overruns.inc(missed)
+            log.warning(f"collecting took {duration:.3f}s, interval is {interval}s - skipping {missed} cycle(s)")
+        n = slot
+
+
+def single(args, cache):
+    # the Export of the cluster given by --url, --user, --jwt-key…
+    if not args.jwt_key:
+        with open(args.jwt_key_file, "rb") as f:
+            key = f.read()
+    else:
+        key = base64.b64decode(args.jwt_key)
+
+    e = Export()
+    if args.use_async:
+        loop = Loop()
+        if args.raw:
+            client = rawconnect(args.user, key, args.url, cache, ASYNC_OPERATIONS, args.token_lifetime, args.token_skew,
+                                asynchronous=True, timeout=args.timeout, uds=args.uds, http2=args.http2)
+        else:
+            client = loop.run(aconnect(args.user, key, args.url, cache, ASYNC_OPERATIONS, args.token_lifetime, args.token_skew,
+                                       timeout=args.timeout, uds=args.uds, http2=args.http2))
+
+        if args.incremental:
+            client = snapshot.Incremental(client, SNAPSHOTS)
+
+        def collect():
+            loop.run(e.acollect(client, args.timeout))
+    else:
+        client = (rawconnect if args.raw else connect)(args.user, key, args.url, cache, OPERATIONS, args.token_lifetime,
+                                                       args.token_skew, timeout=args.timeout, uds=args.uds,
+                                                       http2=args.http2)
+        if args.incremental:
+            client = snapshot.Incremental(client, SNAPSHOTS)
+
+        def collect():
+            e.collect(client)
+
+    return e, collect
+
+
+def positive(value):
+    if (value := float(value)) <= 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0: {value}")
+    return value
 
 
 def main():
@@ -69,55 +620,63 @@ def main():
     parser.add_argument("--jwt-key", "-J")
     parser.add_argument("--url", "-U", default="http://127.0.0.1:6820/openapi.json")
     parser.add_argument("--outfile","-o", default="/var/lib/prometheus/node-exporter/slurmrest.prom")
+    parser.add_argument("--cache-dir", default=None, help="patched description document cache, default ~/.cache/slurmrest")
+    parser.add_argument("--cache-max-age", type=int, default=3600, help="seconds before the description document is checked again")
+    parser.add_argument("--offline", action="store_true", help="never download the description document, use the cache")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--daemon", "-d", action="store_true", help="keep running and refresh the outfile every --interval seconds")
+    parser.add_argument("--interval", "-i", type=positive, default=15)
+    parser.add_argument("--jitter", type=float, default=0, help="random offset of the schedule, up to this many seconds")
+    parser.add_argument("--listen", "-l", help="serve /metrics on [addr:]port instead of writing the outfile, e.g. [::]:9100")
+    parser.add_argument("--max-age", type=float, default=10, help="seconds the metrics are served before collecting again")
+    parser.add_argument("--async", "-a", dest="use_async", action="store_true",
+                        help="collect nodes, jobs, partitions and diag concurrently, always with --clusters")
+    parser.add_argument("--timeout", "-t", type=float, default=10, help="timeout of a single call")
+    parser.add_argument("--raw", "-r", action="store_true",
+                        help="skip model validation, read the fields used from the json directly")
+    parser.add_argument("--incremental", action="store_true",
+                        help="with --raw, poll nodes and jobs with update_time and skip them while nothing changed")
+    parser.add_argument("--token-lifetime", type=int, default=600, help="seconds a signed token is valid")
+    parser.add_argument("--token-skew", type=int, default=60, help="sign a new token this many seconds before it expires")
+    parser.add_argument("--uds", help="connect to slurmrestd listening on this unix socket")
+    parser.add_argument("--http2", action="store_true", help="use HTTP/2, requires httpx[http2]")
+    parser.add_argument("--clusters", "-c", help="export the clusters listed in this file, see example-clusters.yml")
+    parser.add_argument("--concurrency", type=int, default=4, help="clusters collected at once")
 
     args = parser.parse_args()
+    if args.incremental and not args.raw:
+        parser.error("--incremental requires --raw")
 
-    if not args.jwt_key:
-        with open(args.jwt_key_file, "rb") as f:
-            key = f.read()
-    else:
-        key = base64.b64decode(args.jwt_key)
+    cache = None if args.no_cache else SpecCache(args.cache_dir, args.cache_max_age, args.offline)
 
-    e = Export()
-    client = connect(args.user, key, args.url)
-    r = client._.slurmctld_get_nodes()
-    assert r.errors == []
-
-    used_ = collections.defaultdict(lambda: collections.defaultdict(lambda: list()))
-    total_ = collections.defaultdict(lambda: collections.defaultdict(lambda: list()))
-
-    for i in r.nodes:
-        s = i.state
-        if "DRAIN" in i.state_flags:
-            if i.state == "idle":
-                s = "drained"
-            else:
-                s = "draining"
+    if args.clusters:
+        import yaml
 
-        e.state_name.labels(i.name).state(s)
-        e.state_value.labels(i.name).set(Export.STATES.index(s))
+        with open(args.clusters) as f:
+            config = yaml.safe_load(f)
+        loop = Loop()
+        c = clusters(config, cache, lifetime=args.token_lifetime, skew=args.token_skew, use_raw=args.raw,
+                     snapshots=SNAPSHOTS if args.incremental else None, timeout=args.timeout, uds=args.uds,
+                     http2=args.http2)
+        e = Clusters(c, args.timeout, args.concurrency)
 
-        if s not in {"idle","mixed"}:
-            continue
+        def collect():
+            return loop.run(e.acollect())
+    else:
+        e, collect = single(args, cache)
 
-        for name,data in {"tres":total_, "tres_used":used_}.items():
-            value = getattr(i, name)
-            if value is None:
-                continue
-            for k, v in dict(map(lambda y: (y[0], y[2]), map(lambda x: x.partition("="), value.split(",")))).items():
-                data[i.name][k].append(v)
-
-    for pattern,resource in e.values.items():
-        for data,prom in [(used_,resource.used), (total_,resource.total)]:
-            for node, sub in data.items():
-                for res, val in sub.items():
-                    m = re.match(pattern, res)
-                    if not m:
-                        continue
-                    prom.labels(node).set(sum(map(float, val)))
-                    break
-
-    write_to_textfile(args.outfile, e.registry)
+    if not (args.daemon or args.listen):
+        collect()
+        write_to_textfile(args.outfile, e.registry)
+        return
+
+    logging.basicConfig(level=logging.INFO)
+    e.scheduled()
+
+    if args.listen:
+        serve(e, collect, args.listen, args.max_age)
+    else:
+        daemon(e, collect, args.outfile, args.interval, args.jitter)
 
 
 if __name__ == "__main__":
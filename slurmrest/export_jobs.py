@@ -0,0 +1,333 @@
+import argparse
+import asyncio
+import base64
+import datetime
+import json
+import operator
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from slurmrest import export, stream
+from slurmrest.cache import SpecCache
+
+OPERATIONS = ("slurmdbd_get_jobs",)
+
+# how the tres of the steps are combined into the job row, the others are added - averages are divided afterwards
+COMBINE = {"max": max, "min": min}
+
+# slurmdbd has no jobs in the window
+NOTHING_FOUND = 9003
+
+
+def timestamp(value):
+    # epoch seconds or an ISO 8601 date/time, local time without a zone
+    try:
+        return int(value)
+    except ValueError:
+        return int(datetime.datetime.fromisoformat(value).timestamp())
+
+
+def windows(start, end, step):
+    return [(i, min(i + step, end)) for i in range(start, end, step)]
+
+
+def tres(values):
+    # [{"type": "gres", "name": "gpu", "count": 2}, …] → {"gres/gpu": 2, …}
+    return {f"{i['type']}/{i['name']}" if i.get("name") else i["type"]: i.get("count") for i in values or []}
+
+
+def flatten(value, prefix="", row=None):
+    # nested objects become dotted columns, lists of tres columns by resource, other lists strings
+    row = dict() if row is None else row
+    for k, v in value.items():
+        name = f"{prefix}{k}"
+        if isinstance(v, dict):
+            flatten(v, f"{name}.", row)
+        elif isinstance(v, list):
+            if v and isinstance(v[0], dict) and "type" in v[0] and "count" in v[0]:
+                flatten(tres(v), f"{name}.", row)
+            elif all(isinstance(i, (str, int, float)) for i in v):
+                row[name] = ",".join(map(str, v))
+            else:
+                row[name] = json.dumps(v)
+        else:
+            row[name] = v
+    return row
+
+
+def steps(values):
+    # the tres of all steps combined into columns, by the statistic - consumed.max.cpu is the max of the steps
+    r = dict()
+    averages = dict()
+    for s in values:
+        for kind, v in (s.get("tres") or dict()).items():
+            for stat, items in ([(kind, v)] if isinstance(v, list) else v.items()):
+                prefix = f"steps.tres.{kind}.{stat}." if stat != kind else f"steps.tres.{kind}."
+                combine = COMBINE.get(stat, operator.add)
+                for i in items or []:
+                    if (count := i.get("count")) is None:
+                        continue
+                    key = prefix + (f"{i['type']}/{i['name']}" if i.get("name") else i["type"])
+                    r[key] = count if (c := r.get(key)) is None else combine(c, count)
+                    if stat == "average":
+                        averages[key] = averages.get(key, 0) + 1
+    for key, n in averages.items():
+        r[key] /= n
+    return r
+
+
+def row(job):
+    job = dict(job)
+    s = job.pop("steps", None) or []
+    r = flatten(job)
+    r["steps"] = len(s)
+    r.update(steps(s))
+    return r
+
+
+class JSONL:
+    def __init__(self, path):
+        self.f = sys.stdout if path == "-" else open(path, "w")
+        self.rows = 0
+
+    def write(self, rows):
+        self.f.write("".join(json.dumps(i) + "\n" for i in rows))
+        self.rows += len(rows)
+
+    def close(self):
+        if self.f is not sys.stdout:
+            self.f.close()
+
+
+class Parquet:
+    """
+    a row group per batch - the batches are kept in a temporary file each until close() writes them with the columns
+    of all of them, in the order they appeared: columns missing in a batch are null, a column with values of
+    different types gets the common one (int and float → float, null and any → any) or string if there is none
+    """
+
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise SystemExit(f"parquet output requires pyarrow: {e}")
+        self.pa = pyarrow
+        self.path = Path(path)
+        self.rows = 0
+        self._parts = []
+        self._tmp = None
+
+    def _array(self, values):
+        try:
+            return self.pa.array(values)
+        except (self.pa.ArrowInvalid, self.pa.ArrowTypeError):
+            return self.pa.array([v if v is None else str(v) for v in values], self.pa.string())
+
+    def write(self, rows):
+        if self._tmp is None:
+            self._tmp = tempfile.mkdtemp(prefix=f".{self.path.name}.", dir=self.path.parent)
+        names = dict.fromkeys(k for r in rows for k in r)
+        table = self.pa.table({k: self._array([r.get(k) for r in rows]) for k in names})
+        self._parts.append(part := os.path.join(self._tmp, f"{len(self._parts)}.parquet"))
+        self.pa.parquet.write_table(table, part)
+        self.rows += len(rows)
+
+    def _common(self, a, b):
+        try:
+            return self.pa.unify_schemas([self.pa.schema([a]), self.pa.schema([b])], promote_options="permissive")[0]
+        except (self.pa.ArrowInvalid, self.pa.ArrowTypeError):
+            return self.pa.field(a.name, self.pa.string())
+
+    def _schema(self):
+        fields = dict()
+        for part in self._parts:
+            for f in self.pa.parquet.read_schema(part):
+                fields[f.name] = f if (g := fields.get(f.name)) is None or g.type == f.type else self._common(g, f)
+        return self.pa.schema(list(fields.values()))
+
+    def close(self):
+        if self._tmp is None:
+            return
+        try:
+            schema = self._schema()
+            with self.pa.parquet.ParquetWriter(self.path, schema) as writer:
+                for part in self._parts:
+                    table = self.pa.parquet.read_table(part)
+                    writer.write_table(self.pa.table([
+                        table.column(f.name).cast(f.type) if f.name in table.column_names else
+                        self.pa.nulls(len(table), f.type) for f in schema], schema=schema))
+        finally:
+            shutil.rmtree(self._tmp)
+            self._tmp = None
+
+
+class ExportJobs:
+    """
+    streams the jobs of slurmdbd_get_jobs between start and end to a writer, e.g.
+
+        client = export.rawconnect(user, key, url, operations=OPERATIONS, asynchronous=True)
+        await ExportJobs(client, JSONL("jobs.jsonl"), start, end, step=3600, workers=4).run()
+
+    the range is requested in windows of step seconds, workers of them at once, each response is parsed while it is
+    received (stream.Stream) and written in batches of batch rows - memory use does not depend on the length of the range
+    slurmdbd returns the jobs running in a window, so jobs running across windows are returned by each of them, a job
+    is only written by the window its submission falls into (or the first one, if it was submitted before)
+    a window failing before any job was received - an exception, or errors other than NOTHING_FOUND in the response -
+    is split in two down to min_step seconds, the halves are requested by the workers like the other windows
+    an error of the writer stops the workers and is raised by run()
+    """
+
+    def __init__(self, client, writer, start, end, step=86400, workers=4, batch=10000, min_step=600, parameters=None):
+        self.client = client
+        self.writer = writer
+        self.start = start
+        self.end = end
+        self.step = step
+        self.workers = workers
+        self.batch = batch
+        self.min_step = min_step
+        self.parameters = parameters or dict()
+        self.windows = 0
+        self.duplicates = 0
+        self.errors = []
+        self._queue = None
+
+    def _owned(self, job, start, end):
+        submission = (job.get("time") or dict()).get("submission")
+        if submission is None:
+            return True
+        return start <= submission < end or (start == self.start and submission < start)
+
+    def _split(self, start, end, todo):
+        # whether the window was split
+        if end - start <= self.min_step:
+            return False
+        middle = start + (end - start) // 2
+        todo.put_nowait((start, middle))
+        todo.put_nowait((middle, end))
+        return True
+
+    async def _window(self, start, end, todo):
+        s = stream.Stream(self.client, "slurmdbd_get_jobs", "jobs",
+                          {**self.parameters, "start_time": start, "end_time": end})
+        received = 0
+        try:
+            async for job in s:
+                received += 1
+                if self._owned(job, start, end):
+                    await self._queue.put(row(job))
+                else:
+                    self.duplicates += 1
+        except (httpx.HTTPError, ValueError) as e:
+            if received == 0 and self._split(start, end, todo):
+                return
+            self.errors.append((start, end, e))
+            return
+
+        if errors := [e for e in s.data.get("errors") or [] if e.get("error_number", e.get("errno")) != NOTHING_FOUND]:
+            if received == 0 and self._split(start, end, todo):
+                return
+            self.errors.extend((start, end, e.get("error", e)) for e in errors)
+        self.windows += 1
+
+    async def _worker(self, todo):
+        while (window := await todo.get()) is not None:
+            try:
+                await self._window(*window, todo)
+            finally:
+                todo.task_done()
+
+    async def _finish(self, todo):
+        # after the last window the workers and then the writer are stopped
+        await todo.join()
+        for _ in range(self.workers):
+            todo.put_nowait(None)
+        await self._queue.put(None)
+
+    async def _writer(self):
+        rows = []
+        while (r := await self._queue.get()) is not None:
+            rows.append(r)
+            if len(rows) >= self.batch:
+                self.writer.write(rows)
+                rows = []
+        if rows:
+            self.writer.write(rows)
+
+    async def run(self):
+        # at most two batches are buffered, the windows wait for the writer
+        self._queue = asyncio.Queue(self.batch)
+        todo = asyncio.Queue()
+        for i in windows(self.start, self.end, self.step):
+            todo.put_nowait(i)
+        tasks = [asyncio.ensure_future(i) for i in
+                 [self._writer(), self._finish(todo), *[self._worker(todo) for _ in range(self.workers)]]]
+        try:
+            # all of them finish, unless one fails
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for i in done:
+                i.result()
+        finally:
+            for i in tasks:
+                i.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser("export slurmdbd job accounting")
+    parser.add_argument("--start", "-S", required=True, type=timestamp, help="epoch or ISO 8601, e.g. 2023-01-01")
+    parser.add_argument("--end", "-E", type=timestamp, default=int(time.time()))
+    parser.add_argument("--output", "-o", default="-", help="jobs.parquet or jobs.jsonl, - for jsonl on stdout")
+    parser.add_argument("--format", "-f", choices=["jsonl", "parquet"], help="default by the output suffix")
+    parser.add_argument("--window", type=int, default=86400, help="seconds per request")
+    parser.add_argument("--min-window", type=int, default=600, help="failing windows are split down to this")
+    parser.add_argument("--workers", "-w", type=int, default=4, help="windows requested at once")
+    parser.add_argument("--batch", type=int, default=10000, help="rows per write/row group")
+    parser.add_argument("--users", help="comma separated")
+    parser.add_argument("--account", help="comma separated")
+    parser.add_argument("--user", "-u", default="root")
+    parser.add_argument("--jwt-key-file", "-j", default="/etc/slurm/jwt_hs256.key")
+    parser.add_argument("--jwt-key", "-J")
+    parser.add_argument("--url", "-U", default="http://127.0.0.1:6820/openapi.json")
+    parser.add_argument("--cache-dir", default=None, help="patched description document cache, default ~/.cache/slurmrest")
+    parser.add_argument("--timeout", "-t", type=float, default=300, help="timeout of a single window")
+    parser.add_argument("--uds", help="connect to slurmrestd listening on this unix socket")
+    args = parser.parse_args()
+
+    if args.jwt_key:
+        key = base64.b64decode(args.jwt_key)
+    else:
+        with open(args.jwt_key_file, "rb") as f:
+            key = f.read()
+
+    if (fmt := args.format) is None:
+        fmt = "parquet" if args.output.endswith(".parquet") else "jsonl"
+    writer = Parquet(args.output) if fmt == "parquet" else JSONL(args.output)
+
+    client = export.rawconnect(args.user, key, args.url, SpecCache(args.cache_dir), OPERATIONS, asynchronous=True,
+                               timeout=args.timeout, uds=args.uds)
+    parameters = {k: v for k, v in [("users", args.users), ("account", args.account)] if v}
+    e = ExportJobs(client, writer, args.start, args.end, args.window, args.workers, args.batch, args.min_window,
+                   parameters)
+    try:
+        asyncio.run(e.run())
+    finally:
+        writer.close()
+
+    print(json.dumps({"rows": writer.rows, "windows": e.windows, "duplicates": e.duplicates, "errors": len(e.errors)}),
+          file=sys.stderr)
+    for start, end, error in e.errors:
+        print(f"{start}-{end}: {error}", file=sys.stderr)
+    if e.errors:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
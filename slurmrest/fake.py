@@ -0,0 +1,266 @@
+import argparse
+import asyncio
+import base64
+import collections
+import itertools
+import json
+import random
+import re
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+from jwt import JWT
+from jwt.exceptions import JWTException
+from jwt.jwk import jwk_from_dict
+from jwt.utils import b64encode
+
+from slurmrest import synthetic
+
+# operations returning a single item of the collection of another operation
+SINGLE = {
+    "slurmctld_get_job": "slurmctld_get_jobs",
+    "slurmdbd_get_user": "slurmdbd_get_users",
+    "slurmdbd_get_account": "slurmdbd_get_accounts",
+}
+
+# responses with last_update, empty if nothing changed since update_time
+UPDATES = {"slurmctld_get_nodes": "nodes", "slurmctld_get_jobs": "jobs"}
+
+
+class Slurmrestd:
+    """
+    a stand-in for slurmrestd - serves synthetic.spec() and generated payloads, e.g.
+
+        fake = Slurmrestd(key, scale=10000, latency=0.05, error_rate=0.01)
+        httpx.Client(transport=fake.transport())          # in process
+        server = fake.serve(("127.0.0.1", 0))             # tcp, server.url
+        server = fake.serve(uds="/tmp/slurmrestd.socket")  # unix socket
+
+    X-SLURM-USER-TOKEN is validated like slurmrestd does for improve.token - HS256 with key, not expired,
+    sun matching X-SLURM-USER-NAME
+    scale is the number of items of each collection, or a dict operationId → number
+    errors (EAGAIN) are returned with status 500 at error_rate, latency in seconds is added to each request
+    touch() changes the data - get_nodes/get_jobs with update_time return an empty collection until then
+    slurmdbd_get_jobs with start_time/end_time returns the jobs running in between, scale of them per day
+    payloads replaces the generated response of an operationId, e.g. for tests, the requests other than GET are
+    recorded in received as (operationId, parameters, data)
+    """
+
+    def __init__(self, key, scale=1000, latency=0, error_rate=0, versions=("v0.0.37", "v0.0.38"), seed=None):
+        self.key = key
+        self.scale = scale
+        self.latency = latency
+        self.error_rate = error_rate
+        self.document = synthetic.spec(versions)
+        self.last_update = int(time.time())
+        self.requests = collections.Counter()
+        self.payloads = dict()
+        self.received = []
+        self._random = random.Random(seed)
+        self._jwt = JWT()
+        self._signing_key = jwk_from_dict({"kty": "oct", "k": b64encode(base64.b64decode(key))})
+        self._job_id = itertools.count(1000000)
+        self._cache = dict()
+        self._lock = threading.Lock()
+
+        self._routes = []
+        # not improve.operations(), the operationIds are the same in each version
+        for path, item in self.document["paths"].items():
+            pattern = re.compile(re.sub(r"\\{(\w+)\\}", r"(?P<\1>[^/]+)", re.escape(path)) + "$")
+            for method, operation in item.items():
+                self._routes.append((method.upper(), pattern, operation["operationId"]))
+
+    def touch(self):
+        self.last_update += 1
+
+    def _size(self, operationId):
+        return self.scale.get(operationId, 0) if isinstance(self.scale, dict) else self.scale
+
+    def _payload(self, operationId):
+        # the encoded payloads are kept, generating and encoding them dominates otherwise
+        key = (operationId, self._size(operationId))
+        with self._lock:
+            if (r := self._cache.get(key)) is None:
+                r = self._cache[key] = json.dumps(synthetic.response(operationId, key[1])).encode()
+        if operationId in UPDATES:
+            r = b'{"last_update": %d, ' % self.last_update + r[1:]
+        return r
+
+    def authenticate(self, headers):
+        try:
+            token = self._jwt.decode(headers.get("x-slurm-user-token", ""), self._signing_key, algorithms={"HS256"})
+        except JWTException as e:
+            return f"invalid token: {e}"
+        if (user := headers.get("x-slurm-user-name")) is not None and token.get("sun") != user:
+            return f"token is not valid for {user}"
+        return None
+
+    def route(self, method, path):
+        for m, pattern, operationId in self._routes:
+            if m == method and (match := pattern.match(path)) is not None:
+                return operationId, match.groupdict()
+        return None, None
+
+    def handle(self, method, path, query, headers, body):
+        # status, content type, body
+        if path in ["/openapi.json", "/openapi", "/openapi/v3"]:
+            return 200, "application/json", json.dumps(self.document).encode()
+
+        operationId, parameters = self.route(method, path)
+        if operationId is None:
+            return 404, "text/plain", b"Not Found"
+        with self._lock:
+            self.requests[operationId] += 1
+
+        if (error := self.authenticate(headers)) is not None:
+            return 401, "application/json", self._errors(error, 401)
+
+        if self.error_rate and self._random.random() < self.error_rate:
+            # like a busy slurmctld
+            return 500, "application/json", self._errors("Resource temporarily unavailable", 11)
+
+        if method != "GET":
+            with self._lock:
+                self.received.append((operationId, {**query, **parameters}, json.loads(body) if body else None))
+
+        if (data := self.payloads.get(operationId)) is not None:
+            pass
+        elif operationId in SINGLE:
+            data = synthetic.response(SINGLE[operationId], 1)
+        elif operationId == "slurmctld_submit_job":
+            data = {"meta": synthetic.meta(), "errors": [], "job_id": next(self._job_id), "step_id": "batch"}
+        elif (collection := UPDATES.get(operationId)) is not None and \
+                (t := query.get("update_time")) is not None and int(t) >= self.last_update:
+            data = {"meta": synthetic.meta(), "errors": [], "last_update": self.last_update, collection: []}
+        elif operationId == "slurmdbd_get_jobs" and "start_time" in query:
+            # scale jobs per day
+            end = int(query.get("end_time") or time.time())
+            data = {"meta": synthetic.meta(), "errors": [],
+                    "jobs": synthetic.dbjobs(0, int(query["start_time"]), end, max(1, 86400 // (self._size(operationId) or 1)))}
+        elif method == "GET":
+            return 200, "application/json", self._payload(operationId)
+        else:
+            data = {"meta": synthetic.meta(), "errors": []}
+        return 200, "application/json", json.dumps(data).encode()
+
+    def _errors(self, error, errno):
+        return json.dumps({"meta": synthetic.meta(), "errors": [{"error": error, "errno": errno}]}).encode()
+
+    def _response(self, request, status, content_type, body):
+        return httpx.Response(status, headers={"Content-Type": content_type}, content=body, request=request)
+
+    def transport(self, asynchronous=False):
+        # in process, for httpx.Client(transport=…) or httpx.AsyncClient(transport=…)
+        def handle(request):
+            return self.handle(request.method, request.url.path, dict(request.url.params), request.headers,
+                               request.content)
+
+        if asynchronous:
+            async def handler(request):
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                return self._response(request, *handle(request))
+        else:
+            def handler(request):
+                if self.latency:
+                    time.sleep(self.latency)
+                return self._response(request, *handle(request))
+        return httpx.MockTransport(handler)
+
+    def serve(self, address=("127.0.0.1", 0), uds=None):
+        # in a background thread, server.url is the url of the description document
+        if uds is not None:
+            server = UnixHTTPServer(uds, Handler)
+            server.url = "http://localhost/openapi.json"
+        else:
+            server = (HTTPServer6 if ":" in address[0] else HTTPServer)(address, Handler)
+            host = f"[{server.server_address[0]}]" if ":" in address[0] else server.server_address[0]
+            server.url = f"http://{host}:{server.server_address[1]}/openapi.json"
+        server.slurmrestd = self
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        if self.connection.family != socket.AF_UNIX:
+            # headers and body are written separately, avoid the delayed ack
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def address_string(self):
+        return "-"
+
+    def _handle(self):
+        fake = self.server.slurmrestd
+        url = httpx.URL(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if fake.latency:
+            time.sleep(fake.latency)
+        headers = {k.lower(): v for k, v in self.headers.items()}
+        status, content_type, body = fake.handle(self.command, url.path, dict(url.params), headers, body)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_DELETE = _handle
+
+
+class HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class HTTPServer6(HTTPServer):
+    address_family = socket.AF_INET6
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("uds", 0)
+
+
+def main():
+    parser = argparse.ArgumentParser("fake slurmrestd")
+    parser.add_argument("--jwt-key-file", "-j", default="/etc/slurm/jwt_hs256.key")
+    parser.add_argument("--jwt-key", "-J", help="base64")
+    parser.add_argument("--listen", "-l", default="127.0.0.1:6820", help="[addr:]port, e.g. [::1]:6820")
+    parser.add_argument("--uds", help="listen on this unix socket instead")
+    parser.add_argument("--scale", type=int, default=1000, help="items of each collection")
+    parser.add_argument("--latency", type=float, default=0, help="seconds added to each request")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of requests failing with status 500")
+    parser.add_argument("--touch", type=float, default=0, help="change the data every this many seconds")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    if args.jwt_key:
+        key = args.jwt_key
+    else:
+        with open(args.jwt_key_file, "rb") as f:
+            key = base64.b64encode(f.read())
+
+    fake = Slurmrestd(key, args.scale, args.latency, args.error_rate, seed=args.seed)
+    addr, _, port = args.listen.rpartition(":")
+    server = fake.serve((addr.strip("[]") or "0.0.0.0", int(port)), args.uds)
+    print(server.url, flush=True)
+    while True:
+        time.sleep(args.touch or 3600)
+        if args.touch:
+            fake.touch()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,30 @@
 import argparse
+import asyncio
+import collections
+import concurrent.futures
+import functools
 import itertools
 import json
 import base64
+import threading
 import time
 import re
 from pathlib import Path
 
 import httpx
 
-import jmespath
 from jwt import JWT
 from jwt.jwk import jwk_from_dict
 from jwt.utils import b64encode
 
 import aiopenapi3.plugin
 
+from slurmrest import rules
+from slurmrest.util import atomic_write, sha256
 
-def token(key, user):
+
+def token(key, user, interval=600):
     priv_key = base64.b64decode(key)
-    interval = 600
     user = user
 
     signing_key = jwk_from_dict({
@@ -36,11 +42,76 @@ def token(key, user):
     compact_jws = a.encode(message, signing_key, alg='HS256')
     return compact_jws
 
+
+class Token(httpx.Auth):
+    # keeps a signed token and signs a new one skew seconds before it expires
+    # used as httpx auth, every request gets the current token
+    def __init__(self, key, user, lifetime=600, skew=60):
+        self.key = key
+        self.user = user
+        self.lifetime = lifetime
+        self.skew = skew
+        self._lock = threading.Lock()
+        self._current = (None, 0)
+
+    @property
+    def token(self):
+        value, expires = self._current
+        if time.time() < expires - self.skew:
+            return value
+
+        with self._lock:
+            value, expires = self._current
+            if time.time() >= expires - self.skew:
+                expires = time.time() + self.lifetime
+                value = token(self.key, self.user, self.lifetime)
+                self._current = (value, expires)
+            return value
+
+    def __str__(self):
+        return self.token
+
+    def auth_flow(self, request):
+        request.headers["X-SLURM-USER-NAME"] = self.user
+        request.headers["X-SLURM-USER-TOKEN"] = self.token
+        yield request
+
+VERSION = re.compile("(\D+)([\w.]+)")
+
+@functools.lru_cache(maxsize=None)
 def versionof(name):
-    return re.match("(\D+)([\w.]+)", name).groups()
+    return VERSION.match(name).groups()
+
+
+def operations(spec):
+    # operationId -> (method, path, operation)
+    r = dict()
+    for path, item in spec["paths"].items():
+        for method, op in item.items():
+            if isinstance(op, dict) and "operationId" in op:
+                r[op["operationId"]] = (method, path, op)
+    return r
+
+
+def versions(spec):
+    # version -> paths / schemas of the version
+    paths = collections.defaultdict(list)
+    for i in spec["paths"].keys():
+        if not len(p := i.split("/")) > 2:
+            # /openapi/…
+            continue
+        paths[versionof(p[2])[1]].append(i)
+
+    schemas = collections.defaultdict(list)
+    for i in spec["components"]["schemas"].keys():
+        schemas[versionof(i.split("_")[0])[1]].append(i)
+    return paths, schemas
 
 
 def wget_factory(user, token, *args, **kwargs):
+    if isinstance(token, Token):
+        return httpx.Client(*args, auth=token, **kwargs)
+
     session = httpx.Client(*args, **kwargs)
     session.headers.update({
         "X-SLURM-USER-NAME": user,
@@ -49,50 +120,176 @@ def wget_factory(user, token, *args, **kwargs):
     return session
 
 
+class Shared:
+    # aiopenapi3 closes the session after each request, keep the shared client and its connections open
+    def __init__(self, client):
+        self.client = client
+
+    def __getattr__(self, item):
+        return getattr(self.client, item)
+
+    def close(self):
+        pass
+
+    async def aclose(self):
+        pass
+
+    def __enter__(self):
+        return self.client
+
+    def __exit__(self, *args):
+        pass
+
+    async def __aenter__(self):
+        return self.client
+
+    async def __aexit__(self, *args):
+        pass
+
+
+LIMITS = httpx.Limits(max_connections=16, max_keepalive_connections=8, keepalive_expiry=60)
+
+
+def session_factory(user=None, token=None, headers=None, timeout=10, limits=LIMITS, http2=False, uds=None,
+                    verify=True, asynchronous=False):
+    # all sessions returned by the factory share one client and its connection pool
+    # uds connects to slurmrestd listening on a unix socket, the host of the url does not matter then
+    kwargs = dict(headers=headers, timeout=timeout)
+    if isinstance(token, Token):
+        kwargs["auth"] = token
+    elif token is not None:
+        kwargs["headers"] = {**(headers or dict()), "X-SLURM-USER-NAME": user, "X-SLURM-USER-TOKEN": token}
+
+    if asynchronous:
+        transport = httpx.AsyncHTTPTransport(verify=verify, http2=http2, limits=limits, uds=uds)
+        session = Shared(httpx.AsyncClient(transport=transport, **kwargs))
+
+        def factory(*args, **kwargs) -> httpx.AsyncClient:
+            return session
+    else:
+        transport = httpx.HTTPTransport(verify=verify, http2=http2, limits=limits, uds=uds)
+        session = Shared(httpx.Client(transport=transport, **kwargs))
+
+        def factory(*args, **kwargs) -> httpx.Client:
+            return session
+
+    factory.client = session.client
+    return factory
+
+
+def asynchronous(client):
+    # whether the calls of an aiopenapi3 or raw client are coroutines, decided like aiopenapi3 does by the session factory
+    factory = getattr(client, "session_factory", None) or client._session_factory
+    if isinstance(factory, type):
+        return issubclass(factory, httpx.AsyncClient)
+    t = getattr(factory, "__annotations__", dict()).get("return")
+    return isinstance(t, type) and issubclass(t, httpx.AsyncClient)
+
+
 def wget(url, user, token):
-    s = wget_factory(user, token)
-    r = s.get(url)
+    with wget_factory(user, token) as s:
+        r = s.get(url)
     return r
 
 
+def document(url, version, session_factory=httpx.Client, operations=None):
+    # the patched description document, see SpecCache.document for a cached one
+    with session_factory() as s:
+        r = s.get(url)
+    r.raise_for_status()
+    return patch(r.json(), version, operations)
+
+
+async def adocument(url, version, session_factory=httpx.AsyncClient, operations=None):
+    # document() for an asynchronous session factory, see SpecCache.adocument for a cached one
+    async with session_factory() as s:
+        r = await s.get(url)
+    r.raise_for_status()
+    return patch(r.json(), version, operations)
+
+
+@functools.lru_cache(maxsize=None)
+def patchversion():
+    # identifies the patch code - cached documents are only valid for the code which created them
+    return sha256(Path(__file__).read_bytes() + Path(rules.__file__).read_bytes())
+
+
+HTTP_METHODS = frozenset(["get", "put", "post", "delete", "options", "head", "patch", "trace"])
+
+
+def references(value):
+    # all $ref values below value
+    todo = [value]
+    while todo:
+        v = todo.pop()
+        if isinstance(v, dict):
+            if isinstance(r := v.get("$ref"), str):
+                yield r
+            todo.extend(v.values())
+        elif isinstance(v, list):
+            todo.extend(v)
+
+
+def prune(spec, allowed):
+    # keep the allowed operations and the components reachable from them
+    allowed = frozenset(allowed)
+    if (missing := allowed - operations(spec).keys()):
+        raise KeyError(f"unknown operations {sorted(missing)}")
+
+    for path, item in list(spec["paths"].items()):
+        for method in HTTP_METHODS & item.keys():
+            if item[method].get("operationId") not in allowed:
+                del item[method]
+        if not HTTP_METHODS & item.keys():
+            del spec["paths"][path]
+
+    components = spec.get("components", dict())
+    reachable = set()
+    todo = list(references(spec["paths"]))
+    while todo:
+        if (ref := todo.pop()) in reachable or not ref.startswith("#/components/"):
+            continue
+        reachable.add(ref)
+        _, _, kind, name = ref.split("/", 3)
+        if (v := components.get(kind, dict()).get(name)) is not None:
+            todo.extend(references(v))
+
+    for kind, values in components.items():
+        if kind == "securitySchemes":
+            # referenced by name from security requirements
+            continue
+        for name in list(values.keys()):
+            if f"#/components/{kind}/{name}" not in reachable:
+                del values[name]
+    return spec
+
+
+def patch(spec, version, operations=None):
+    for i in ["", "db"]:
+        apply(spec, f"{i}{version}", f"/slurm{i}/{version}")
+    if operations is not None:
+        prune(spec, operations)
+    return spec
+
+
 class OnDocument(aiopenapi3.plugin.Document):
-    def __init__(self, version):
+    def __init__(self, version, operations=None):
         super().__init__()
         self._version = version
+        self._operations = operations
     def parsed(self, ctx):
-        spec = ctx.document
-        for i in ["", "db"]:
-            apply(spec, f"{i}{self._version}", f"/slurm{i}/{self._version}")
+        patch(ctx.document, self._version, self._operations)
         return ctx
 
 
+def normalize(operationId, data):
+    # the payload fixups matching the schema changes in apply(), see rules
+    return rules.rewrite(operationId, data)
+
+
 class OnMessage(aiopenapi3.plugin.Message):
     def parsed(self, ctx):
-        if ctx.operationId == "slurmctld_get_jobs":
-            data = ctx.parsed
-            # job_resources
-            for job in range(len(data["jobs"])):
-                if 'allocated_nodes' not in data['jobs'][job]['job_resources']:
-                    continue
-                data['jobs'][job]['job_resources']['allocated_nodes'] = \
-                    [{**i, "node": k} for k, i in data['jobs'][job]['job_resources']['allocated_nodes'].items()]
-
-            # node_allocation
-            for job in range(len(data["jobs"])):
-                if 'allocated_nodes' not in data['jobs'][job]['job_resources']:
-                    continue
-                for node in range(len(data['jobs'][job]['job_resources']['allocated_nodes'])):
-                    new = [
-                        {"core": k, "type": v}
-                        for k, v in data['jobs'][job]['job_resources']['allocated_nodes'][node]['cores'].items()
-                    ]
-                    data['jobs'][job]['job_resources']['allocated_nodes'][node]['cores'] = new
-                for node in range(len(data['jobs'][job]['job_resources']['allocated_nodes'])):
-                    new = [
-                        {"socket": k, "type": v}
-                        for k, v in data['jobs'][job]['job_resources']['allocated_nodes'][node]['sockets'].items()
-                    ]
-                    data['jobs'][job]['job_resources']['allocated_nodes'][node]['sockets'] = new
+        normalize(ctx.operationId, ctx.parsed)
         return ctx
 
 
@@ -100,29 +297,29 @@ def apply(spec, version, live=''):
 
     _,v0 = versionof(version)
 
+    paths, schemas = versions(spec)
+
     # remove all oeprations besides the choosen one …
-    for i in jmespath.search("paths|keys(@)", spec):
-        if not len((p:=Path(i)).parts) > 2:
-            # /openapi/…
-            continue
-        _, v1 = versionof(p.parts[2])
+    for v1, names in paths.items():
         if v0 == v1:
             continue
-        del spec['paths'][i]
+        for i in names:
+            del spec['paths'][i]
 
     # remove all components …
-    for i in list(spec["components"]["schemas"].keys()):
-        _, v1 = versionof(i.split("_")[0])
-        if v0 != v1:
+    for v1, names in schemas.items():
+        if v0 == v1:
+            continue
+        for i in names:
             del spec["components"]["schemas"][i]
 
+    index = {k: op for k, (_, _, op) in operations(spec).items()}
 
     def operationof(name):
-
-        if (r:= jmespath.search(f"paths.[*][].[*][][?operationId == '{name}'][]", spec)):
-            return r[0]
-        elif(r:= jmespath.search(f"""paths.[*][].[*][][?operationId == '{name.partition("_")[2]}'][]""", spec)):
-            return r[0]
+        if (r := index.get(name)) is not None:
+            return r
+        elif (r := index.get(name.partition("_")[2])) is not None:
+            return r
         raise KeyError(name)
 
     spec['components']['schemas'].update({
@@ -173,32 +370,33 @@ def apply(spec, version, live=''):
         },
     })
 
+    metas = set([f"{version}_pings",
+                 f"{version}_job_submission",
+                 f"{version}_response_user_update",
+                 f"{version}_user_info",
+                 f"{version}_account_info",
+                 f"{version}_account_response",
+                 f"{version}_response_account_delete",
+                 f"{version}_jobs_response",
+                 f"{version}_job_info",
+                 f"{version}_nodes_response",
+                 f"{version}_partitions_response",
+                 f"{version}_diag",
+                 f"{version}_job_submission_response",
+                 f"{version}_tres_info",
+                 f"{version}_associations_info",
+                 f"{version}_cluster_info",
+                 f"{version}_config_info",
+                 f"{version}_qos_info",
+                 f"{version}_wckey_info",
+                 f"{version}_response_user_delete", # v0.0.37
+                 ])
     for k, v in spec['components']['schemas'].items():
         if not "properties" in v:
 #            print(f"{k} {v}")
             continue
 
-        if k in set([f"{version}_pings",
-                     f"{version}_job_submission",
-                     f"{version}_response_user_update",
-                     f"{version}_user_info",
-                     f"{version}_account_info",
-                     f"{version}_account_response",
-                     f"{version}_response_account_delete",
-                     f"{version}_jobs_response",
-                     f"{version}_job_info",
-                     f"{version}_nodes_response",
-                     f"{version}_partitions_response",
-                     f"{version}_diag",
-                     f"{version}_job_submission_response",
-                     f"{version}_tres_info",
-                     f"{version}_associations_info",
-                     f"{version}_cluster_info",
-                     f"{version}_config_info",
-                     f"{version}_qos_info",
-                     f"{version}_wckey_info",
-                     f"{version}_response_user_delete", # v0.0.37
-                     ]):
+        if k in metas:
             v["properties"].update({"meta": {"$ref": f"#/components/schemas/{version}_meta"}, })
 
 
@@ -219,44 +417,7 @@ def apply(spec, version, live=''):
         # this is basically completely broken and not compatible to openapi
         # using dicts with dynamic index for lists
 
-        spec['components']['schemas'][f'{version}_job_resources']['properties']["allocated_nodes"] = {
-            "type": "array",
-            "description": "node allocations",
-            "items": {
-                "$ref": f"#/components/schemas/{version}_node_allocation"
-            }
-        }
-
-        spec['components']['schemas'][f'{version}_node_allocation']['properties']["cores"] = {
-            "type":"array",
-            "description":"FIXME",
-            "items": {
-                "type":"object",
-                "properties": {
-                    "core":{
-                        "type":"integer",
-                    },
-                    "type": {
-                        "type":"string"
-                    }
-                }
-            }
-        }
-        spec['components']['schemas'][f'{version}_node_allocation']['properties']["sockets"] = {
-            "type":"array",
-            "description":"FIXME",
-            "items": {
-                "type":"object",
-                "properties": {
-                    "socket":{
-                        "type":"integer",
-                    },
-                    "type": {
-                        "type":"string"
-                    }
-                }
-            }
-        }
+        rules.patch(spec, version)
         spec['components']['schemas'][f'{version}_node_allocation']['properties']["cpus"] = {"type":"integer"}
 
         del spec['components']['schemas'][f"{version}_job_properties"]["properties"]["account_gather_freqency"]
@@ -325,9 +486,9 @@ def apply(spec, version, live=''):
 
 
         # 400/500 error handling via default
-        for i in jmespath.search("paths.[*][].[*][][].operationId", spec):
+        for i in index.values():
             for code,desc in {400:"Invalid Request",500:"Internal Error"}.items():
-                operationof(i)["responses"].update(
+                i["responses"].update(
                     {
                         f"{code}": {
                             "description": desc,
@@ -585,6 +746,135 @@ def apply(spec, version, live=''):
     return spec
 
 
+SOURCE = "https://raw.githubusercontent.com/SchedMD/slurm/master/src/plugins/openapi/{name}{version}/openapi.json"
+
+
+async def download(urls, out, store, offline=False, timeout=30):
+    """
+    the documents of urls (file name → url) in out, fetched concurrently over one client
+
+    out/manifest.json keeps url, sha256, ETag and Last-Modified per file - the requests are conditional and an
+    unchanged document costs a 304, the documents are kept in store/<sha256>.json
+    a file in out is only written if its content changed, offline writes them from the store without any request
+    returns file name → status
+    """
+    path = out / "manifest.json"
+    try:
+        manifest = json.loads(path.read_bytes())
+    except FileNotFoundError:
+        manifest = dict()
+    original = json.dumps(manifest, indent=2)
+
+    def place(name, digest):
+        target = out / name
+        if target.exists() and sha256(target.read_bytes()) == digest:
+            return False
+        atomic_write(target, (store / f"{digest}.json").read_bytes())
+        return True
+
+    async def get(session, name, url):
+        entry = manifest.get(name) or dict()
+        known = entry.get("url") == url and (store / f"{entry.get('sha256')}.json").exists()
+        if offline:
+            if not known:
+                return "missing"
+            return "offline" if place(name, entry["sha256"]) else "unchanged"
+
+        headers = dict()
+        if known:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            r = await session.get(url, headers=headers)
+            if r.status_code != 304 or not known:
+                r.raise_for_status()
+        except httpx.HTTPError as e:
+            return f"error {e}"
+
+        if r.status_code == 304:
+            digest = entry["sha256"]
+        else:
+            digest = sha256(r.content)
+            if not (p := store / f"{digest}.json").exists():
+                atomic_write(p, r.content)
+        manifest[name] = {"url": url, "sha256": digest, "etag": r.headers.get("ETag", entry.get("etag")),
+                          "last_modified": r.headers.get("Last-Modified", entry.get("last_modified"))}
+        changed = place(name, digest)
+        return f"{r.status_code} {'updated' if changed else 'unchanged'}"
+
+    async with httpx.AsyncClient(timeout=timeout, limits=LIMITS, follow_redirects=True) as session:
+        status = await asyncio.gather(*[get(session, name, url) for name, url in urls.items()])
+    if (data := json.dumps(manifest, indent=2)) != original:
+        atomic_write(path, data.encode())
+    return dict(zip(urls, status))
+
+
+def patched(path):
+    # the patched document of the file, in a worker process
+    source = path.read_bytes()
+    data = json.dumps(apply(json.loads(source), path.stem), indent=2).encode()
+    return sha256(source), data
+
+
+def build(old, new, slurm=None, jobs=None, force=False):
+    """
+    the documents in old patched into new (and the openapi plugins of the slurm source tree, if it exists)
+
+    new/manifest.json keeps the sha256 of the source, patchversion() and the sha256 of the output per document -
+    documents whose source and patch code did not change are skipped, the others are patched in a process pool
+    outputs are written atomically and only if their content differs
+    a document failing does not stop the others, it is not in the manifest and is patched again next time
+    returns name → status, "error …" for those failing
+    """
+    path = new / "manifest.json"
+    try:
+        manifest = json.loads(path.read_bytes())
+    except FileNotFoundError:
+        manifest = dict()
+
+    def targets(i):
+        r = [new / i.name]
+        if slurm is not None and slurm.exists():
+            r.append(slurm / "src" / "plugins" / "openapi" / i.stem / "openapi.json")
+        return r
+
+    def current(target, digest):
+        return target.exists() and sha256(target.read_bytes()) == digest
+
+    # the manifest and store of get are not documents
+    sources = sorted(i for i in old.iterdir() if i.is_file() and i.suffix == ".json" and i.name != "manifest.json")
+    status = dict()
+    todo = []
+    version = patchversion()
+    for i in sources:
+        entry = manifest.get(i.name) or dict()
+        if not force and entry.get("patch") == version and entry.get("source") == sha256(i.read_bytes()) and \
+                all(current(t, entry.get("output")) for t in targets(i)):
+            status[i.name] = "unchanged"
+        else:
+            todo.append(i)
+
+    if todo:
+        with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+            for i, f in [(i, pool.submit(patched, i)) for i in todo]:
+                manifest.pop(i.name, None)
+                try:
+                    source, data = f.result()
+                    digest = sha256(data)
+                    written = [t for t in targets(i) if not current(t, digest)]
+                    for t in written:
+                        atomic_write(t, data)
+                except Exception as e:
+                    status[i.name] = f"error {e!r}"
+                    continue
+                manifest[i.name] = {"source": source, "patch": version, "output": digest}
+                status[i.name] = "patched" if written else "same"
+        atomic_write(path, json.dumps(manifest, indent=2).encode())
+    return {i.name: status[i.name] for i in sources}
+
+
 def create_parser():
     parser = argparse.ArgumentParser("SLURMrestd API testing", description="…")
 
@@ -592,15 +882,23 @@ def create_parser():
 
     cmd = sub.add_parser("get")
     cmd.add_argument("--out", default="data/src")
+    cmd.add_argument("--url", default=SOURCE, help="{name} is v/dbv, {version} 0.0.x")
+    cmd.add_argument("--versions", nargs="+", default=[f'0.0.{i}' for i in range(37, 39)])
+    cmd.add_argument("--store", help="content addressed store of the documents, default <out>/.store")
+    cmd.add_argument("--offline", action="store_true", help="write the documents of the manifest from the store")
+    cmd.add_argument("--timeout", type=float, default=30)
 
     def cmd_get(args):
-        for name, version in itertools.product(["dbv", "v"], list(f'0.0.{i}' for i in range(37, 39))):
-            url = f"https://raw.githubusercontent.com/SchedMD/slurm/master/src/plugins/openapi/{name}{version}/openapi.json"
-            out = Path(args.out) / f"{name}{version}.json"
-            if not (p := out.parent).exists():
-                p.mkdir(parents=True)
-            r = httpx.get(url)
-            out.open("wt").write(r.text)
+        out = Path(args.out)
+        store = Path(args.store) if args.store else out / ".store"
+        urls = {f"{name}{version}.json": args.url.format(name=name, version=version)
+                for name, version in itertools.product(["dbv", "v"], args.versions)}
+        failed = 0
+        for name, status in asyncio.run(download(urls, out, store, args.offline, args.timeout)).items():
+            print(f"{status:10} {out / name}")
+            failed += status == "missing" or status.startswith("error")
+        if failed:
+            raise SystemExit(1)
 
     cmd.set_defaults(func=cmd_get)
 
@@ -608,20 +906,17 @@ def create_parser():
     cmd.add_argument("--old", default="data/src")
     cmd.add_argument("--new", default="data/dst")
     cmd.add_argument("--slurm", default="~/workspace/slurm/")
+    cmd.add_argument("--jobs", "-j", type=int, default=None, help="processes, default the number of cpus")
+    cmd.add_argument("--force", action="store_true", help="patch all documents, ignore the manifest")
 
     def cmd_patch(args):
-        if not (p := Path(args.new)).exists():
-            p.mkdir(parents=True)
-
-        for i in Path(args.old).iterdir():
-            data = json.loads(i.open("r").read())
-            data = apply(data, i.stem)
-            (Path(args.new) / i.name).open('wt').write((data:=json.dumps(data, indent=2)))
-
-            if not (s:=Path(args.slurm).expanduser()).exists():
-                continue
-            (s / "src"/"plugins"/"openapi"/ i.stem / "openapi.json").open('wt').write(data)
-#            name,version,_ = re.match("(\D+)([\w.]+)",i.stem).groups()
+        failed = 0
+        for name, status in build(Path(args.old), Path(args.new), Path(args.slurm).expanduser(), args.jobs,
+                                  args.force).items():
+            print(f"{status:10} {name}")
+            failed += status.startswith("error")
+        if failed:
+            raise SystemExit(1)
 
     cmd.set_defaults(func=cmd_patch)
 
@@ -0,0 +1,95 @@
+import collections
+import functools
+import types
+
+import httpx
+
+from slurmrest import improve
+
+
+@functools.lru_cache(maxsize=None)
+def record(name, fields):
+    # tuple backed, no __dict__ per instance
+    return collections.namedtuple(name, fields)
+
+
+def namespace(value):
+    if isinstance(value, dict):
+        return types.SimpleNamespace(**{k: namespace(v) for k, v in value.items()})
+    elif isinstance(value, list):
+        return [namespace(i) for i in value]
+    return value
+
+
+class Operations:
+    # client._.operationId(parameters=…, data=…) like aiopenapi3
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, item):
+        if item not in self._client.operations:
+            raise AttributeError(item)
+        return functools.partial(self._client.request, item)
+
+
+class Client:
+    """
+    calls operations of the patched description document without building or validating models
+
+    the json received is normalized like OnMessage does and returned as namespace,
+    for operations listed in fields the collection is returned as records
+    of the requested fields only, e.g.
+
+        fields={"slurmctld_get_nodes": ("nodes", ("name", "state"))}
+    """
+
+    def __init__(self, url, document, session_factory=httpx.Client, fields=None):
+        servers = document.get("servers") or [{"url": "/"}]
+        self.url = httpx.URL(url).join(servers[0]["url"])
+        self.operations = improve.operations(document)
+        self.session_factory = session_factory
+        self.fields = fields or dict()
+        self._ = Operations(self)
+
+    def _prepare(self, operationId, parameters):
+        method, path, _ = self.operations[operationId]
+        params = dict()
+        for k, v in (parameters or dict()).items():
+            if (name := f"{{{k}}}") in path:
+                path = path.replace(name, str(v))
+            else:
+                params[k] = v
+        return method.upper(), self.url.join(path.lstrip("/")), params
+
+    def _process(self, operationId, r):
+        if r.headers.get("Content-Type", "").partition(";")[0] != "application/json":
+            r.raise_for_status()
+            raise ValueError(f"{operationId}: unexpected content type {r.headers.get('Content-Type')}")
+
+        data = improve.normalize(operationId, r.json())
+        if (f := self.fields.get(operationId)) is None:
+            return namespace(data)
+
+        collection, fields = f
+        items = data.pop(collection, None) or []
+        t = record(collection, tuple(fields))
+        r = namespace(data)
+        setattr(r, collection, [t._make(map(i.get, fields)) for i in items])
+        return r
+
+    def request(self, operationId, parameters=None, data=None):
+        method, url, params = self._prepare(operationId, parameters)
+        with self.session_factory() as session:
+            r = session.request(method, url, params=params, json=data)
+        return self._process(operationId, r)
+
+
+class AsyncClient(Client):
+    def __init__(self, url, document, session_factory=httpx.AsyncClient, fields=None):
+        super().__init__(url, document, session_factory, fields)
+
+    async def request(self, operationId, parameters=None, data=None):
+        method, url, params = self._prepare(operationId, parameters)
+        async with self.session_factory() as session:
+            r = await session.request(method, url, params=params, json=data)
+        return self._process(operationId, r)
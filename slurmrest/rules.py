@@ -0,0 +1,173 @@
+import collections
+
+
+# slurmctld returns some lists as dicts with a dynamic index, e.g.
+#   "allocated_nodes": {"0": {…}, "1": {…}}
+# which is not compatible to openapi
+# a Rule keeps the schema patch for apply() together with the payload rewrite for OnMessage
+
+
+class Rule:
+    def __init__(self, operations, path, schema, prop, transform, definition):
+        # operations returning the payload, path into the payload - "*" for each item of a list
+        self.operations = operations
+        self.path = path
+        # the property of the {version}_{schema} component
+        self.schema = schema
+        self.prop = prop
+        self.transform = transform
+        # version → schema of the property
+        self.definition = definition
+
+    def patch(self, spec, version):
+        spec['components']['schemas'][f'{version}_{self.schema}']['properties'][self.prop] = self.definition(version)
+
+
+def index_items(name):
+    # {"0": {…}} → [{…, name: "0"}], the items are reused
+    def transform(value):
+        if not isinstance(value, dict):
+            return value
+        for k, i in value.items():
+            i[name] = k
+        return list(value.values())
+    return transform
+
+
+def index_pairs(name, value_name):
+    # {"0": "x"} → [{name: "0", value_name: "x"}]
+    def transform(value):
+        if not isinstance(value, dict):
+            return value
+        return [{name: k, value_name: v} for k, v in value.items()]
+    return transform
+
+
+def pairs_schema(name, value_name):
+    return lambda version: {
+        "type": "array",
+        "description": "FIXME",
+        "items": {
+            "type": "object",
+            "properties": {
+                name: {
+                    "type": "integer",
+                },
+                value_name: {
+                    "type": "string"
+                }
+            }
+        }
+    }
+
+
+JOBS = ("slurmctld_get_jobs", "slurmctld_get_job")
+
+RULES = [
+    Rule(JOBS, ("jobs", "*", "job_resources", "allocated_nodes"), "job_resources", "allocated_nodes",
+         index_items("node"),
+         lambda version: {
+             "type": "array",
+             "description": "node allocations",
+             "items": {
+                 "$ref": f"#/components/schemas/{version}_node_allocation"
+             }
+         }),
+    # applied after allocated_nodes became a list
+    Rule(JOBS, ("jobs", "*", "job_resources", "allocated_nodes", "*", "cores"), "node_allocation", "cores",
+         index_pairs("core", "type"), pairs_schema("core", "type")),
+    Rule(JOBS, ("jobs", "*", "job_resources", "allocated_nodes", "*", "sockets"), "node_allocation", "sockets",
+         index_pairs("socket", "type"), pairs_schema("socket", "type")),
+]
+
+
+def patch(spec, version, rules=RULES):
+    for rule in rules:
+        rule.patch(spec, version)
+
+
+def tree(rules):
+    # merge the paths of the rules into a trie, the transform is stored with the key None
+    root = dict()
+    for rule in rules:
+        node = root
+        for key in rule.path:
+            node = node.setdefault(key, dict())
+        node[None] = rule.transform
+    return root
+
+
+def build(node):
+    # a function rewriting a value in place, descending into each branch of the trie once
+    # transforms are applied before descending, so nested rules see the rewritten value
+    # the value is returned for transformer()
+    steps = []
+    for key, child in node.items():
+        if key is None:
+            continue
+        transform = child.get(None)
+        sub = build(child) if len(child) > (transform is not None) else None
+        steps.append((key, transform, sub))
+
+    if len(steps) == 1 and steps[0][0] == "*" and steps[0][1] is None:
+        # the common case, a single branch into each item of a list
+        sub = steps[0][2]
+
+        def each(value):
+            if isinstance(value, list):
+                for i in value:
+                    sub(i)
+            return value
+    else:
+        def each(value):
+            for key, transform, sub in steps:
+                if key == "*":
+                    if isinstance(value, list):
+                        for n, i in enumerate(value):
+                            if transform is not None:
+                                i = value[n] = transform(i)
+                            if sub is not None:
+                                sub(i)
+                elif isinstance(value, dict) and (v := value.get(key)) is not None:
+                    if transform is not None:
+                        v = value[key] = transform(v)
+                    if sub is not None:
+                        sub(v)
+            return value
+    return each
+
+
+def transformers(rules=RULES):
+    # operationId → trie of its rules
+    byop = collections.defaultdict(list)
+    for rule in rules:
+        for operationId in rule.operations:
+            byop[operationId].append(rule)
+    return {operationId: tree(r) for operationId, r in byop.items()}
+
+
+TREES = transformers()
+TRANSFORMERS = {operationId: build(t) for operationId, t in TREES.items()}
+
+
+def transformer(operationId, prefix=()):
+    # the transformer for the value at prefix, e.g. ("jobs", "*") for a single job, returning the rewritten value
+    # None if there is nothing to rewrite
+    if (node := TREES.get(operationId)) is None:
+        return None
+    if not prefix:
+        return TRANSFORMERS[operationId]
+    for key in prefix:
+        if (node := node.get(key)) is None:
+            return None
+    if (transform := node.get(None)) is None:
+        return build(node)
+    # a rule for the value itself
+    sub = build(node)
+    return lambda value: sub(transform(value))
+
+
+def rewrite(operationId, data):
+    if (t := TRANSFORMERS.get(operationId)) is not None:
+        t(data)
+    return data
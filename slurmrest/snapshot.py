@@ -0,0 +1,90 @@
+from slurmrest import raw
+
+
+def timestamp(value):
+    # last_update is a number up to v0.0.38, {"set": …, "number": …} later
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, dict):
+        return value.get("number") if value.get("set", True) else None
+    return getattr(value, "number", None) if getattr(value, "set", True) else None
+
+
+class Snapshot:
+    """
+    the collection of a raw.Client/raw.AsyncClient operation by key, polled with update_time, e.g.
+
+        s = Snapshot(client, "slurmctld_get_nodes", "nodes", "name")
+        r = s.poll()
+        s.items["node001"]
+
+    slurmctld does not send deltas - if anything changed since update_time the complete collection is returned,
+    if nothing changed the collection is empty.
+    so a poll without change transfers and parses next to nothing and returns the previous response (s.changed is False),
+    with a change the snapshot is replaced.
+    without last_update in the response update_time is not used, every poll gets the complete collection.
+    """
+
+    def __init__(self, client, operationId, collection, key, parameters=None):
+        self.client = client
+        self.operationId = operationId
+        self.collection = collection
+        self.key = key
+        self.parameters = parameters
+        self.items = dict()
+        self.last_update = None
+        self.response = None
+        self.changed = False
+
+    def _parameters(self):
+        parameters = dict(self.parameters or dict())
+        if self.last_update is not None:
+            parameters["update_time"] = self.last_update
+        return parameters
+
+    def _update(self, r):
+        if getattr(r, "errors", None):
+            # not merged, the caller sees the errors
+            self.changed = True
+            return r
+
+        last_update = timestamp(getattr(r, "last_update", None))
+        items = getattr(r, self.collection, None) or []
+        if self.last_update is not None and not items and (last_update is None or last_update <= self.last_update):
+            self.changed = False
+            return self.response
+
+        self.items = {getattr(i, self.key): i for i in items}
+        self.last_update = last_update
+        self.response = r
+        self.changed = True
+        return r
+
+    def poll(self):
+        return self._update(self.client.request(self.operationId, self._parameters()))
+
+    async def apoll(self):
+        return self._update(await self.client.request(self.operationId, self._parameters()))
+
+
+class Incremental:
+    """
+    a raw.Client/raw.AsyncClient which polls the operations in keys with a Snapshot, e.g.
+
+        client = Incremental(client, {"slurmctld_get_nodes": ("nodes", "name")})
+        client._.slurmctld_get_nodes()
+
+    the response object is the same as long as nothing changed
+    """
+
+    def __init__(self, client, keys):
+        self.client = client
+        self.operations = client.operations
+        self.snapshots = {operationId: Snapshot(client, operationId, collection, key)
+                          for operationId, (collection, key) in keys.items()}
+        self._ = raw.Operations(self)
+
+    def request(self, operationId, parameters=None, data=None):
+        if parameters is None and data is None and (s := self.snapshots.get(operationId)) is not None:
+            return s.apoll() if isinstance(self.client, raw.AsyncClient) else s.poll()
+        return self.client.request(operationId, parameters, data)
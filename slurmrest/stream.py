@@ -0,0 +1,244 @@
+import codecs
+import json
+import re
+
+from slurmrest import raw, rules
+
+
+WHITESPACE = " \t\n\r"
+
+# what matters while looking for the end of a value, the rest is skipped by the regex
+STRUCTURE = re.compile(r'["{}\[\]]')
+STRING = re.compile(r'["\\]')
+SCALAR_END = re.compile(r"[\s,\]}]")
+
+
+class Items:
+    """
+    incremental parser for a json object with one large array member
+
+    feed() the bytes as they arrive, it returns the elements of the array which are complete,
+    all other members of the object are collected in .data
+    memory use is bounded by the size of a single element
+
+    an incomplete value is not decoded again before its end was received, the search for the end resumes where
+    the previous chunk ended
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.data = dict()
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._state = "start"
+        self._key = None
+        # the search for the end of the value at _pos - where it continues, the bracket depth, inside a string
+        self._scan = None
+        self._depth = 0
+        self._string = False
+
+    def _skip(self):
+        while self._pos < len(self._buf) and self._buf[self._pos] in WHITESPACE:
+            self._pos += 1
+        return self._buf[self._pos] if self._pos < len(self._buf) else None
+
+    def _end(self, eof):
+        # the end of the value at _pos, None while it is incomplete - at eof the rest is left to raw_decode
+        buf = self._buf
+        if self._scan is None:
+            self._scan, self._depth, self._string = self._pos, 0, False
+        if buf[self._pos] not in '{["':
+            if m := SCALAR_END.search(buf, self._scan):
+                return m.start()
+            self._scan = len(buf)
+            return len(buf) if eof else None
+
+        i = self._scan
+        while True:
+            if self._string:
+                if (m := STRING.search(buf, i)) is None:
+                    i = len(buf)
+                    break
+                if m.group() == "\\":
+                    if m.end() == len(buf):
+                        # the escaped character is in the next chunk
+                        i = m.start()
+                        break
+                    i = m.end() + 1
+                    continue
+                self._string = False
+                i = m.end()
+            else:
+                if (m := STRUCTURE.search(buf, i)) is None:
+                    i = len(buf)
+                    break
+                i = m.end()
+                if m.group() == '"':
+                    self._string = True
+                    continue
+                self._depth += 1 if m.group() in "{[" else -1
+            if self._depth == 0 and not self._string:
+                return i
+        self._scan = i
+        return len(buf) if eof else None
+
+    def _decode(self, eof):
+        if self._scan is None and self._buf[self._pos] in '{["':
+            # mostly the value was received completely, a number may continue in the next chunk
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                if end < len(self._buf) or eof:
+                    self._pos = end
+                    return True, value
+        # decoded again only once its end was received
+        if self._end(eof) is None:
+            return False, None
+        value, self._pos = self._decoder.raw_decode(self._buf, self._pos)
+        self._scan = None
+        return True, value
+
+    def _expect(self, c, chars):
+        if c not in chars:
+            raise ValueError(f"unexpected {c!r} at {self._state}, expected one of {chars!r}")
+        self._pos += 1
+
+    def _parse(self, eof=False):
+        # the states are named after what comes next, first_ ones may also close the object/array
+        items = []
+        while (c := self._skip()) is not None:
+            if self._state == "start":
+                self._expect(c, "{")
+                self._state = "first_key"
+            elif self._state in ("first_key", "key"):
+                if c == "}" and self._state == "first_key":
+                    self._pos += 1
+                    self._state = "end"
+                    continue
+                if c != '"':
+                    self._expect(c, '"')
+                done, self._key = self._decode(eof)
+                if not done:
+                    break
+                self._state = "colon"
+            elif self._state == "colon":
+                self._expect(c, ":")
+                self._state = "value"
+            elif self._state == "value":
+                if self._key == self.collection and c == "[":
+                    self._pos += 1
+                    self._state = "first_item"
+                    continue
+                done, value = self._decode(eof)
+                if not done:
+                    break
+                self.data[self._key] = value
+                self._state = "next"
+            elif self._state in ("first_item", "item"):
+                if c == "]" and self._state == "first_item":
+                    self._pos += 1
+                    self._state = "next"
+                    continue
+                if c in ",]}:":
+                    raise ValueError(f"unexpected {c!r} at {self._state}")
+                done, value = self._decode(eof)
+                if not done:
+                    break
+                items.append(value)
+                if self._skip() == ",":
+                    # the next element follows, without another round for the separator
+                    self._pos += 1
+                    self._state = "item"
+                else:
+                    self._state = "next_item"
+            elif self._state == "next_item":
+                self._expect(c, ",]")
+                self._state = "item" if c == "," else "next"
+            elif self._state == "next":
+                self._expect(c, ",}")
+                self._state = "key" if c == "," else "end"
+            else:
+                raise ValueError(f"trailing data {c!r}")
+
+        if self._scan is not None:
+            self._scan -= self._pos
+        self._buf = self._buf[self._pos:]
+        self._pos = 0
+        return items
+
+    def feed(self, chunk):
+        self._buf += self._text.decode(chunk)
+        return self._parse()
+
+    def close(self):
+        self._buf += self._text.decode(b"", final=True)
+        items = self._parse(eof=True)
+        if self._state != "end":
+            raise ValueError(f"incomplete document, {self._state}")
+        return items
+
+
+class Stream:
+    """
+    iterate over the collection of a raw.Client/raw.AsyncClient operation while it is received, e.g.
+
+        s = Stream(client, "slurmctld_get_jobs", "jobs")
+        for job in s:
+            …
+        assert s.data["errors"] == []
+
+    each element is normalized like OnMessage does, with fields only these are returned as record
+    """
+
+    def __init__(self, client, operationId, collection, parameters=None, fields=None, chunk_size=64 * 1024):
+        self.client = client
+        self.operationId = operationId
+        self.collection = collection
+        self.parameters = parameters
+        self.fields = fields
+        self.chunk_size = chunk_size
+        self.data = None
+        self._rewrite = rules.transformer(operationId, (collection, "*"))
+
+    def _item(self, value):
+        if self._rewrite is not None:
+            value = self._rewrite(value)
+        if self.fields is None:
+            return value
+        return raw.record(self.collection, tuple(self.fields))._make(map(value.get, self.fields))
+
+    def _check(self, r):
+        if r.headers.get("Content-Type", "").partition(";")[0] != "application/json":
+            r.raise_for_status()
+            raise ValueError(f"{self.operationId}: unexpected content type {r.headers.get('Content-Type')}")
+
+    def __iter__(self):
+        method, url, params = self.client._prepare(self.operationId, self.parameters)
+        parser = Items(self.collection)
+        with self.client.session_factory() as session:
+            with session.stream(method, url, params=params) as r:
+                self._check(r)
+                for chunk in r.iter_bytes(self.chunk_size):
+                    for i in parser.feed(chunk):
+                        yield self._item(i)
+        for i in parser.close():
+            yield self._item(i)
+        self.data = parser.data
+
+    async def __aiter__(self):
+        method, url, params = self.client._prepare(self.operationId, self.parameters)
+        parser = Items(self.collection)
+        async with self.client.session_factory() as session:
+            async with session.stream(method, url, params=params) as r:
+                self._check(r)
+                async for chunk in r.aiter_bytes(self.chunk_size):
+                    for i in parser.feed(chunk):
+                        yield self._item(i)
+        for i in parser.close():
+            yield self._item(i)
+        self.data = parser.data
@@ -0,0 +1,166 @@
+import asyncio
+import concurrent.futures
+import random
+import time
+
+import httpx
+
+from slurmrest import improve
+
+# slurm errors worth another try - slurmctld busy or not reachable from slurmrestd
+# EAGAIN, SLURMCTLD_COMMUNICATIONS_{CONNECTION,SEND,RECEIVE,SHUTDOWN}_ERROR, SLURM_PROTOCOL_SOCKET_IMPL_TIMEOUT,
+# SLURM_PROTOCOL_SOCKET_ZERO_BYTES_SENT
+TRANSIENT = {11, 1001, 1002, 1003, 1004, 5004, 5005}
+
+
+class SubmitError(Exception):
+    def __init__(self, errors, attempts=1):
+        self.errors = errors
+        self.attempts = attempts
+        super().__init__("; ".join(str(getattr(i, "error", i)) for i in errors))
+
+
+def errno(error):
+    # v0.0.37 has errno, the patched documents error_number
+    for i in ("errno", "error_number"):
+        if (value := getattr(error, i, None)) is not None:
+            return value
+    return None
+
+
+def template(client, job, script=None):
+    """
+    the job_submission for the job properties in job, validated once with the model of the description document
+    if the client has one (aiopenapi3), as dict - the specs submitted are merged into it without building models
+    """
+    data = {"job": job}
+    if script is not None:
+        data["script"] = script
+    operation = getattr(client._, "slurmctld_submit_job")
+    if (body := getattr(operation, "data", None)) is not None:
+        data = body.get_type().parse_obj(data).dict(exclude_unset=True)
+    return data
+
+
+def merge(template, spec):
+    # spec are job properties, "script" replaces the script
+    spec = dict(spec)
+    data = {"job": {**template["job"], **spec}}
+    if (script := data["job"].pop("script", template.get("script"))) is not None:
+        data["script"] = script
+    if "environment" in spec:
+        data["job"]["environment"] = {**template["job"].get("environment", dict()), **spec["environment"]}
+    return data
+
+
+class Submit:
+    """
+    submits job specs concurrently, e.g. a parameter sweep
+
+        t = template(client, {"account": "root", "partition": "debug", "current_working_directory": "/tmp",
+                              "environment": {"PATH": "/bin:/usr/bin"}}, "#!/bin/bash\nsrun echo it works")
+        async for spec, r in Submit(client, t, concurrency=8, rate=20).run({"name": f"sweep-{i}"} for i in range(1000)):
+            print(spec["name"], r)  # job_id or exception
+
+    client is an aiopenapi3 OpenAPI or a raw.Client/raw.AsyncClient, synchronous calls are made in threads
+    at most concurrency submissions are in flight and specs are only taken from the iterable when there is room,
+    they are started at most rate per second
+    errors in TRANSIENT and transport errors are retried up to retries times with exponential backoff and jitter,
+    results are returned in completion order
+    """
+
+    def __init__(self, client, template, concurrency=8, rate=None, retries=5, backoff=0.5, max_backoff=30,
+                 transient=TRANSIENT):
+        self.client = client
+        self.template = template
+        self.concurrency = concurrency
+        self.interval = 1 / rate if rate else 0
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.transient = transient
+        self.submitted = 0
+        self.retried = 0
+        self.failed = 0
+        self._next = 0
+        self._random = random.Random()
+        self._asynchronous = improve.asynchronous(client)
+        self._executor = None
+
+    async def _slot(self):
+        # rate cap, the start times are spaced by interval
+        if not self.interval:
+            return
+        now = time.monotonic()
+        start = max(now, self._next)
+        self._next = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def _request(self, data):
+        if self._asynchronous:
+            return await self.client._.slurmctld_submit_job(data=data)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, lambda: self.client._.slurmctld_submit_job(data=data))
+
+    async def _submit(self, spec):
+        data = merge(self.template, spec)
+        attempt = 0
+        while True:
+            await self._slot()
+            try:
+                r = await self._request(data)
+                errors = list(getattr(r, "errors", None) or [])
+                transient = errors and all(errno(i) in self.transient for i in errors)
+            except httpx.TransportError as e:
+                errors, transient = [e], True
+            except Exception as e:
+                errors, transient = [e], False
+
+            if not errors:
+                self.submitted += 1
+                return spec, r.job_id
+            if not transient or attempt >= self.retries:
+                self.failed += 1
+                return spec, SubmitError(errors, attempt + 1)
+
+            delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+            await asyncio.sleep(delay * self._random.uniform(0.5, 1))
+            attempt += 1
+            self.retried += 1
+
+    async def run(self, specs):
+        specs = iter(specs)
+        pending = set()
+        if not self._asynchronous:
+            self._executor = concurrent.futures.ThreadPoolExecutor(self.concurrency)
+        try:
+            while True:
+                while len(pending) < self.concurrency and (spec := next(specs, None)) is not None:
+                    pending.add(asyncio.ensure_future(self._submit(spec)))
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for i in done:
+                    yield i.result()
+        finally:
+            # stopped early, the submissions in flight are abandoned - their jobs may have been submitted anyway
+            for i in pending:
+                i.cancel()
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+
+
+def submit(client, template, specs, **kwargs):
+    # Submit(…).run() for synchronous code
+    loop = asyncio.new_event_loop()
+    results = Submit(client, template, **kwargs).run(specs)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(results.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(results.aclose())
+        loop.close()
@@ -0,0 +1,353 @@
+import re
+
+# synthetic description documents and payloads for benchmarks and the fake slurmrestd
+# the documents contain what improve.apply() patches, not the whole api - payloads are shaped like slurmrestd's
+
+
+def obj(**properties):
+    return {"type": "object", "properties": properties}
+
+
+def array(items):
+    return {"type": "array", "items": items}
+
+
+def ref(version, name):
+    return {"$ref": f"#/components/schemas/{version}_{name}"}
+
+
+def responses(version, name):
+    content = {"application/json": {"schema": ref(version, name)}}
+    return {"200": {"description": "success", "content": content}, "default": {"description": "error", "content": content}}
+
+
+def string():
+    # new dicts for each property, aiopenapi3 must not see shared objects
+    return {"type": "string"}
+
+
+def integer():
+    return {"type": "integer"}
+
+
+CTLD = {
+    "/slurm/{v}/jobs": {"get": ("slurmctld_get_jobs", "jobs_response")},
+    "/slurm/{v}/job/{{job_id}}": {"get": ("slurmctld_get_job", "jobs_response"),
+                                  "delete": ("slurmctld_cancel_job", "pings")},
+    "/slurm/{v}/job/submit": {"post": ("slurmctld_submit_job", "job_submission_response")},
+    "/slurm/{v}/nodes": {"get": ("slurmctld_get_nodes", "nodes_response")},
+    "/slurm/{v}/partitions": {"get": ("slurmctld_get_partitions", "partitions_response")},
+    "/slurm/{v}/diag": {"get": ("slurmctld_diag", "diag")},
+    "/slurm/{v}/ping": {"get": ("slurmctld_ping", "pings")},
+}
+
+DBD = {
+    "/slurmdb/{v}/users/": {"get": ("slurmdbd_get_users", "user_info"), "post": ("slurmdbd_update_users", "response_user_update")},
+    "/slurmdb/{v}/user/{{user_name}}": {"get": ("slurmdbd_get_user", "user_info"),
+                                        "delete": ("slurmdbd_delete_user", "response_user_update")},
+    "/slurmdb/{v}/accounts/": {"get": ("slurmdbd_get_accounts", "account_info"),
+                               "post": ("slurmdbd_update_account", "account_response")},
+    "/slurmdb/{v}/account/{{account_name}}": {"get": ("slurmdbd_get_account", "account_info"),
+                                              "delete": ("slurmdbd_delete_account", "response_account_delete")},
+    "/slurmdb/{v}/associations/": {"get": ("slurmdbd_get_associations", "associations_info")},
+    "/slurmdb/{v}/association/": {"get": ("slurmdbd_get_association", "associations_info"),
+                                  "delete": ("slurmdbd_delete_association", "response_association_delete")},
+    "/slurmdb/{v}/diag/": {"get": ("slurmdbd_diag", "diag")},
+    "/slurmdb/{v}/tres/": {"get": ("slurmdbd_get_tres", "tres_info")},
+    "/slurmdb/{v}/clusters/": {"get": ("slurmdbd_get_clusters", "cluster_info")},
+    "/slurmdb/{v}/config": {"get": ("slurmdbd_get_db_config", "config_info")},
+    "/slurmdb/{v}/qos/": {"get": ("slurmdbd_get_qos", "qos_info")},
+    "/slurmdb/{v}/wckeys/": {"get": ("slurmdbd_get_wckeys", "wckey_info")},
+    "/slurmdb/{v}/jobs/": {"get": ("slurmdbd_get_jobs", "job_info")},
+}
+
+QUERY = {
+    "slurmctld_get_jobs": ["update_time"],
+    "slurmctld_get_nodes": ["update_time"],
+    "slurmdbd_get_jobs": ["start_time", "end_time", "users", "account"],
+    "slurmdbd_get_association": ["account", "cluster", "user", "partition"],
+    "slurmdbd_delete_association": ["account", "cluster", "user", "partition"],
+}
+
+
+def schemas(v, d):
+    errors = lambda version: array(ref(version, "error"))
+    r = dict()
+    for i in [v, d]:
+        r[f"{i}_error"] = obj(error=string(), errno=integer())
+        r[f"{i}_meta"] = obj(plugin=obj(type=string(), name=string()), Slurm=obj(version=obj(major=integer(), micro=integer(), minor=integer()), release=string()))
+    r.update({
+        f"{v}_job_submission": obj(script=string(), job={"description": "job", **ref(v, "job_properties")}),
+        f"{v}_job_submission_response": obj(errors=errors(v), job_id=integer(), step_id=string()),
+        f"{v}_job_properties": obj(account=string(), name=string(), partition=string(), account_gather_freqency=string(), environment={"type": "object"},
+                                   current_working_directory=string(), tasks=integer()),
+        f"{v}_job_resources": obj(nodes=string(), allocated_cores=integer(), allocated_hosts=integer(), allocated_nodes={"type": "object"}),
+        f"{v}_node_allocation": obj(memory=integer(), cpus=integer(), sockets={"type": "object"}, cores={"type": "object"}),
+        f"{v}_job_response_properties": obj(job_id=integer(), name=string(), job_state=string(), partition=string(), account=string(), user_name=string(), cpus=integer(),
+                                            node_count=integer(), tres_req_str=string(), tres_alloc_str=string(), state_reason=string(),
+                                            submit_time=integer(), start_time=integer(), end_time=integer(), last_update=integer(),
+                                            job_resources=ref(v, "job_resources")),
+        f"{v}_jobs_response": obj(meta=ref(v, "meta"), errors=errors(v), jobs=array(ref(v, "job_response_properties"))),
+        f"{v}_node": obj(name=string(), hostname=string(), state=string(), state_flags=array(string()), cpus=integer(), real_memory=integer(), partitions=array(string()),
+                         tres=string(), tres_used=string(), last_update=integer()),
+        f"{v}_nodes_response": obj(meta=ref(v, "meta"), errors=errors(v), nodes=array(ref(v, "node"))),
+        f"{v}_partition": obj(name=string(), nodes=string(), total_nodes=integer(), total_cpus=integer()),
+        f"{v}_partitions_response": obj(meta=ref(v, "meta"), errors=errors(v), partitions=array(ref(v, "partition"))),
+        f"{v}_diag": obj(meta=ref(v, "meta"), errors=errors(v),
+                         statistics=obj(**{i: integer() for i in ["server_thread_count", "agent_queue_size", "jobs_submitted",
+                                                          "jobs_started", "jobs_pending", "jobs_running"]})),
+        f"{v}_pings": obj(meta=ref(v, "meta"), errors=errors(v)),
+    })
+
+    r.update({
+        f"{d}_tres_list": array(obj(type=string(), name=string(), id=integer(), count=integer())),
+        f"{d}_user": obj(name=string(), default=obj(account=string(), wckey=string()), associations={"type": "object"},
+                         coordinators=array(string()), administrator_level=string()),
+        f"{d}_user_info": obj(meta=ref(d, "meta"), errors=errors(d), users=array(ref(d, "user"))),
+        f"{d}_association_short_info": obj(account=string(), cluster=string(), partition=string(), user=string()),
+        f"{d}_account": obj(name=string(), description=string(), organization=string(), associations=array(ref(d, "association_short_info")),
+                            coordinators=array(string()), flags=array(string())),
+        f"{d}_account_info": obj(meta=ref(d, "meta"), errors=errors(d), accounts=array(ref(d, "account"))),
+        f"{d}_response_account_delete": obj(meta=ref(d, "meta"), errors=errors(d)),
+        f"{d}_response_user_update": obj(meta=ref(d, "meta"), errors=errors(d)),
+        f"{d}_response_association_delete": obj(meta=ref(d, "meta"), errors=errors(d), removed_associations=array(string())),
+        f"{d}_account_response": obj(meta=ref(d, "meta"), errors=errors(d)),
+        f"{d}_diag": obj(meta=ref(d, "meta"), errors=errors(d), users=array({"type": "object"}),
+                         RPCs=array({"type": "object"}), rollups=array(obj(type=string())), time_start=integer()),
+        f"{d}_tres_info": obj(meta=ref(d, "meta"), errors=errors(d), tres=array({"type": "object"})),
+        f"{d}_association": obj(account=string(), user=string(), cluster=string(), partition=string(), max=obj(jobs=obj(per=obj(wall_clock=integer())))),
+        f"{d}_associations_info": obj(meta=ref(d, "meta"), errors=errors(d), associations=array(ref(d, "association"))),
+        f"{d}_cluster_info": obj(name=string(), associations=obj(), errors=errors(d)),
+        f"{d}_config_info": obj(meta=ref(d, "meta"), errors=errors(d), tres=array({"type": "object"}),
+                                qos=array(ref(d, "qos"))),
+        f"{d}_qos": obj(name=string(), description=string(), limits=obj(max=obj(tres=obj(minutes=obj(per=obj()))))),
+        f"{d}_qos_info": obj(meta=ref(d, "meta"), errors=errors(d), qos=array(ref(d, "qos"))),
+        f"{d}_wckey_info": obj(meta=ref(d, "meta"), errors=errors(d)),
+        f"{d}_job_step": obj(step=obj(name=string(), id=string())),
+        f"{d}_job": obj(job_id=integer(), name=string(), account=string(), user=string(), partition=string(), state=obj(current=string(), reason=string()),
+                        time=obj(submission=integer(), start=integer(), end=integer(), elapsed=integer()),
+                        het=obj(job_id=string(), job_offset=string()), steps=array(ref(d, "job_step")),
+                        tres=obj(allocated=ref(d, "tres_list"), requested=ref(d, "tres_list"))),
+        f"{d}_job_info": obj(meta=ref(d, "meta"), errors=errors(d), jobs=array(ref(d, "job"))),
+    })
+    return r
+
+
+def paths(v, d, extra=0):
+    r = dict()
+    for version, ops in [(v, CTLD), (d, DBD)]:
+        for path, methods in ops.items():
+            path = path.format(v=version)
+            r[path] = {method: {"operationId": operationId, "responses": responses(version, response)}
+                       for method, (operationId, response) in methods.items()}
+
+    r[f"/slurm/{v}/job/submit"]["post"]["requestBody"] = {"content": {"application/json": {"schema": ref(v, "job_submission")}}}
+
+    for path, methods in r.items():
+        for operation in methods.values():
+            operation["parameters"] = [{"name": i, "in": "path", "required": True, "schema": string()}
+                                       for i in re.findall(r"{(\w+)}", path)]
+            operation["parameters"] += [{"name": i, "in": "query", "schema": string()}
+                                        for i in QUERY.get(operation["operationId"], [])]
+
+    # to scale the document
+    for i in range(extra):
+        r[f"/slurm/{v}/extra{i}"] = {"get": {"operationId": f"slurmctld_extra{i}", "responses": responses(v, "pings")}}
+    return r
+
+
+def spec(versions=("v0.0.37", "v0.0.38"), extra=0):
+    # an openapi.json as slurmrestd serves it - all versions in one document
+    document = {
+        "openapi": "3.0.2",
+        "info": {"title": "Slurm Rest API", "version": "synthetic"},
+        "servers": [{"url": "/"}],
+        "security": [{"user": [], "token": []}],
+        "components": {
+            "securitySchemes": {
+                "user": {"type": "apiKey", "in": "header", "name": "X-SLURM-USER-NAME"},
+                "token": {"type": "apiKey", "in": "header", "name": "X-SLURM-USER-TOKEN"},
+            },
+            "schemas": dict(),
+        },
+        "paths": {"/openapi": {"get": {"operationId": "openapi_get", "responses": {"200": {"description": "openapi"}}}}},
+    }
+    for v in versions:
+        document["paths"].update(paths(v, f"db{v}", extra))
+        document["components"]["schemas"].update(schemas(v, f"db{v}"))
+    return document
+
+
+STATES = ["idle", "mixed", "allocated", "allocated", "mixed", "down"]
+
+
+def nodes(n):
+    r = []
+    for i in range(n):
+        gpus = 4 if i % 4 == 0 else 0
+        r.append({
+            "name": f"n{i:06}",
+            "hostname": f"n{i:06}",
+            "state": STATES[i % len(STATES)],
+            "state_flags": ["DRAIN"] if i % 50 == 0 else [],
+            "cpus": 64,
+            "real_memory": 256000,
+            "partitions": [f"p{i % 8}"],
+            "tres": "cpu=64,mem=256000M,billing=64" + (f",gres/gpu={gpus},gres/gpu:a100={gpus}" if gpus else ""),
+            "tres_used": f"cpu={i % 65},mem={(i % 64) * 4000}M" + (f",gres/gpu={i % (gpus + 1)}" if gpus else ""),
+            "last_update": 1700000000 + i,
+        })
+    return r
+
+
+EPOCH = 1700000000
+JOB_STATES = ["PENDING", "RUNNING", "RUNNING", "RUNNING", "COMPLETING", "PENDING"]
+REASONS = ["Priority", "Resources", "Dependency", "QOSMaxJobsPerUserLimit"]
+
+
+def allocation(i, nodes, cores):
+    # dicts with a dynamic index like slurmctld sends them, see rules
+    return {
+        str(k): {
+            "memory": 4000,
+            "cpus": cores,
+            "cores": {str(c): "allocated" if (c + i) % 3 else "unallocated" for c in range(cores)},
+            "sockets": {"0": "assigned", "1": "unassigned"},
+        } for k in range(nodes)
+    }
+
+
+def jobs(n, users=None, accounts=None, partitions=8, nodes=2, cores=8):
+    users = users or max(1, n // 50)
+    accounts = accounts or max(1, users // 10)
+    r = []
+    for i in range(n):
+        state = JOB_STATES[i % len(JOB_STATES)]
+        cpus = 1 + i % 32
+        job = {
+            "job_id": i + 1,
+            "name": f"job{i}",
+            "job_state": state,
+            "partition": f"p{i % partitions}",
+            "account": f"a{i % accounts}",
+            "user_name": f"u{i % users}",
+            "cpus": cpus,
+            "node_count": 1 + i % nodes,
+            "tres_req_str": f"cpu={cpus},mem={cpus * 2}G,node=1,billing={cpus}" + (",gres/gpu=1" if i % 7 == 0 else ""),
+            "state_reason": REASONS[i % len(REASONS)] if state == "PENDING" else "None",
+            "submit_time": 1700000000 + i,
+            "start_time": 0 if state == "PENDING" else 1700000100 + i,
+            "end_time": 0,
+            "last_update": 1700000100 + i,
+            "job_resources": {},
+        }
+        if state != "PENDING":
+            job["job_resources"] = {"nodes": f"n{i % 1000:06}", "allocated_cores": cpus, "allocated_hosts": 1 + i % nodes,
+                                    "allocated_nodes": allocation(i, 1 + i % nodes, cores)}
+        r.append(job)
+    return r
+
+
+def tres(cpus, gpus=0):
+    r = [{"type": "cpu", "name": "", "id": 1, "count": cpus}, {"type": "mem", "name": "", "id": 2, "count": cpus * 2048},
+         {"type": "node", "name": "", "id": 4, "count": 1}]
+    if gpus:
+        r.append({"type": "gres", "name": "gpu", "id": 1001, "count": gpus})
+    return r
+
+
+def dbjob(i, interval=60, duration=3600, users=100, accounts=10, cluster="cluster"):
+    # job i of slurmdbd_get_jobs, submitted at EPOCH + i * interval
+    submission = EPOCH + i * interval
+    cpus = 1 + i % 32
+    gpus = 1 if i % 7 == 0 else 0
+    usage = {"average": tres(cpus // 2 or 1), "max": tres(cpus), "min": tres(1), "total": tres(cpus * 10)}
+    return {
+        "job_id": i + 1,
+        "name": f"job{i}",
+        "account": f"a{i % accounts}",
+        "user": f"u{i % users}",
+        "partition": f"p{i % 8}",
+        "cluster": cluster,
+        "state": {"current": "COMPLETED", "reason": "None"},
+        "time": {"submission": submission, "start": submission + 60, "end": submission + 60 + duration,
+                 "elapsed": duration},
+        "het": {"job_id": 0, "job_offset": 0},
+        "tres": {"allocated": tres(cpus, gpus), "requested": tres(cpus, gpus)},
+        "steps": [{"step": {"name": name, "id": f"{i + 1}.{name}"}, "task": {"distribution": "block"},
+                   "tres": {"requested": usage, "consumed": usage, "allocated": tres(cpus, gpus)}}
+                  for name in ["batch", "0"]],
+    }
+
+
+def dbjobs(n, start=None, end=None, interval=60, duration=3600):
+    # the jobs running between start and end, all n without
+    if start is None:
+        return [dbjob(i, interval, duration) for i in range(n)]
+    first = max(0, (start - EPOCH - 60 - duration) // interval)
+    last = max(0, (end - EPOCH) // interval + 1)
+    return [dbjob(i, interval, duration) for i in range(first, last)
+            if EPOCH + i * interval <= end and EPOCH + i * interval + 60 + duration >= start]
+
+
+def users(n, accounts=None, cluster="cluster"):
+    accounts = accounts or max(1, n // 10)
+    return [{
+        "name": f"u{i}",
+        "default": {"account": f"a{i % accounts}", "wckey": ""},
+        "administrator_level": "None",
+        "coordinators": [],
+        "associations": [{"account": f"a{i % accounts}", "cluster": cluster, "partition": None, "user": f"u{i}"}],
+    } for i in range(n)]
+
+
+def accounts(n, cluster="cluster"):
+    return [{
+        "name": f"a{i}",
+        "description": f"account {i}",
+        "organization": "synthetic",
+        "coordinators": [],
+        "flags": [],
+        "associations": [{"account": f"a{i}", "cluster": cluster, "partition": None, "user": None}],
+    } for i in range(n)]
+
+
+def associations(n, accounts=None, cluster="cluster"):
+    accounts = accounts or max(1, n // 10)
+    return [{"account": f"a{i % accounts}", "user": f"u{i}", "cluster": cluster, "partition": None,
+             "max": {"jobs": {"per": {"wall_clock": 1440}}}} for i in range(n)]
+
+
+def partitions(n, nodes=1000):
+    return [{"name": f"p{i}", "nodes": f"n[{i:06}-{nodes:06}]", "total_nodes": nodes // n, "total_cpus": 64 * nodes // n}
+            for i in range(n)]
+
+
+def diag():
+    return {"server_thread_count": 3, "agent_queue_size": 0, "jobs_submitted": 1000, "jobs_started": 900,
+            "jobs_pending": 100, "jobs_running": 800}
+
+
+def meta():
+    return {"plugin": {"type": "openapi/synthetic", "name": "synthetic"},
+            "Slurm": {"version": {"major": 21, "micro": 0, "minor": 8}, "release": "21.08.0"}}
+
+
+def response(operationId, n):
+    # the response of the operation with n items
+    collections = {
+        "slurmctld_get_nodes": ("nodes", nodes),
+        "slurmctld_get_jobs": ("jobs", jobs),
+        "slurmctld_get_partitions": ("partitions", lambda n: partitions(max(1, min(n, 16)), n)),
+        "slurmdbd_get_users": ("users", users),
+        "slurmdbd_get_accounts": ("accounts", accounts),
+        "slurmdbd_get_associations": ("associations", associations),
+        "slurmdbd_get_jobs": ("jobs", dbjobs),
+    }
+    r = {"meta": meta(), "errors": []}
+    if operationId == "slurmctld_diag":
+        r["statistics"] = diag()
+    elif (c := collections.get(operationId)) is not None:
+        name, f = c
+        r[name] = f(n)
+    return r
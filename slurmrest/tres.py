@@ -0,0 +1,78 @@
+import functools
+import re
+import sys
+
+
+# trackable resources as slurm formats them, e.g.
+#   cpu=64,mem=256000M,billing=64,gres/gpu=4,gres/gpu:a100=4
+# parsed into (key, value) pairs, values are numbers, memory sizes in MB
+
+UNITS = {"": 1, "K": 1 / 1024, "M": 1, "G": 1024, "T": 1024 ** 2, "P": 1024 ** 3}
+
+NUMBER = re.compile(r"(\d+(?:\.\d+)?)([KMGTP]?)")
+
+GROUPNAME = re.compile(r"\(\?P<\w+>")
+
+CACHE_SIZE = 64 * 1024
+
+
+def number(value):
+    # None if not a number
+    if (m := NUMBER.fullmatch(value)) is None:
+        return None
+    n, unit = m.groups()
+    n = (int(n) if "." not in n else float(n)) * UNITS[unit]
+    return int(n) if isinstance(n, float) and n.is_integer() else n
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def parse(value):
+    # the keys are interned, the strings of all nodes share them, None is no resources
+    if not value:
+        return ()
+    r = []
+    for item in value.split(","):
+        if not item:
+            continue
+        k, _, v = item.partition("=")
+        r.append((sys.intern(k), number(v)))
+    return tuple(r)
+
+
+class Matcher:
+    """
+    maps tres strings to a vector with the value of each resource, e.g.
+
+        m = Matcher(["^cpu", "^gres/gpu"])
+        m.vector("cpu=64,mem=256000M,gres/gpu=4") == (64, 4)
+
+    the first key matching the pattern of a resource is used, None if there is none
+    """
+
+    def __init__(self, patterns, cache_size=CACHE_SIZE):
+        self.patterns = tuple(patterns)
+        # one regex for all resources, the groups of the patterns are not captured, none without resources
+        self._re = re.compile("|".join(f"(?P<r{n}>{GROUPNAME.sub('(?:', p)})" for n, p in enumerate(self.patterns))
+                              or "(?!)")
+        self._resource = dict()
+        self.vector = functools.lru_cache(maxsize=cache_size)(self._vector)
+
+    def resource(self, key):
+        # index of the resource for the key, None if it matches none
+        try:
+            return self._resource[key]
+        except KeyError:
+            pass
+        if (m := self._re.match(key)) is None:
+            n = None
+        else:
+            n = next(n for n in range(len(self.patterns)) if m.start(f"r{n}") != -1)
+        self._resource[key] = n
+        return n
+
+    def _vector(self, value):
+        r = [None] * len(self.patterns)
+        for k, v in parse(value):
+            if (n := self.resource(k)) is not None and r[n] is None and v is not None:
+                r[n] = v
+        return tuple(r)
@@ -0,0 +1,24 @@
+import base64
+import functools
+
+import pytest
+
+from slurmrest import export, fake
+from slurmrest.cache import SpecCache
+
+KEY = b"secret"
+
+
+@pytest.fixture
+def slurmrestd():
+    # the fake on a free port, slurmrestd.slurmrestd is the fake itself
+    server = fake.Slurmrestd(base64.b64encode(KEY), scale=100, seed=0).serve()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def connect(slurmrestd, tmp_path):
+    # export.rawconnect(…) to the fake, e.g. connect(operations, asynchronous=True)
+    return functools.partial(export.rawconnect, "root", KEY, slurmrestd.url, SpecCache(tmp_path))
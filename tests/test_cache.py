@@ -0,0 +1,109 @@
+import asyncio
+import base64
+import re
+import threading
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+from slurmrest import cache, fake
+from slurmrest.cache import SpecCache
+
+
+def test_adocument_concurrent(tmp_path):
+    # the coroutines wait for the first one instead of fetching the document themselves
+    transport = fake.Slurmrestd(base64.b64encode(b"secret"), latency=0.1).transport(asynchronous=True)
+    sessions = []
+
+    def session_factory() -> httpx.AsyncClient:
+        sessions.append(None)
+        return httpx.AsyncClient(transport=transport)
+
+    async def documents(cache):
+        return await asyncio.wait_for(asyncio.gather(*[
+            cache.adocument("http://slurmrestd/openapi.json", "v0.0.37", session_factory, ("slurmctld_get_jobs",))
+            for _ in range(4)]), 30)
+
+    r = asyncio.run(documents(SpecCache(tmp_path)))
+    assert len(sessions) == 1
+    assert all(i == r[0] for i in r)
+    assert "slurmctld_get_jobs" in str(r[0])
+
+
+def operationIds():
+    # the live tests have one test per operation of v0.0.37
+    with open(Path(__file__).parent.parent / "pytest_slurmapi.py") as f:
+        return set(re.findall(r"^def test_(slurm\w+)\(", f.read(), re.M))
+
+
+def test_invalidates():
+    names = operationIds()
+    assert set(cache.INVALIDATES) <= names
+    assert {i for v in cache.INVALIDATES.values() for i in v} <= names
+    assert set(cache.TTLS) <= names
+    # every operation changing something is listed
+    assert {i for i in names if not re.search(r"_get_|_diag$|_ping$", i)} == set(cache.INVALIDATES)
+
+
+def test_submit(connect):
+    c = cache.ResponseCache(connect(("slurmctld_get_partitions", "slurmctld_submit_job")))
+    c._.slurmctld_get_partitions()
+    assert c._.slurmctld_submit_job(data={"job": {"name": "x"}}).job_id
+    c._.slurmctld_get_partitions()
+    assert (c.hits["slurmctld_get_partitions"], c.invalidated) == (1, 0)
+
+
+def test_invalidated_while_fetching(slurmrestd, connect):
+    # the response requested before the invalidation is not kept
+    c = cache.ResponseCache(connect(("slurmdbd_get_qos",)))
+    slurmrestd.slurmrestd.latency = 0.3
+    t = threading.Thread(target=c._.slurmdbd_get_qos)
+    t.start()
+    time.sleep(0.1)
+    c.invalidate(["slurmdbd_get_qos"])
+    t.join()
+    slurmrestd.slurmrestd.latency = 0
+    c._.slurmdbd_get_qos()
+    c._.slurmdbd_get_qos()
+    assert (c.misses["slurmdbd_get_qos"], c.hits["slurmdbd_get_qos"]) == (2, 1)
+
+
+def test_invalidated_while_fetching_async(slurmrestd, connect):
+    async def run(c):
+        slurmrestd.slurmrestd.latency = 0.3
+        fetch = asyncio.ensure_future(c._.slurmdbd_get_qos())
+        await asyncio.sleep(0.1)
+        c.invalidate(["slurmdbd_get_qos"])
+        await fetch
+        slurmrestd.slurmrestd.latency = 0
+        await c._.slurmdbd_get_qos()
+        await c._.slurmdbd_get_qos()
+
+    c = cache.ResponseCache(connect(("slurmdbd_get_qos",), asynchronous=True))
+    asyncio.run(run(c))
+    assert (c.misses["slurmdbd_get_qos"], c.hits["slurmdbd_get_qos"]) == (2, 1)
+
+
+def test_document_stale_fallback(tmp_path):
+    # a failing refresh falls back to the cached document, without one it raises
+    transport = fake.Slurmrestd(base64.b64encode(b"secret")).transport()
+    operations = ("slurmctld_get_jobs",)
+    url = "http://slurmrestd/openapi.json"
+    specs = SpecCache(tmp_path, max_age=0)
+    spec = specs.document(url, "v0.0.37", lambda: httpx.Client(transport=transport), operations)
+
+    def failing(status):
+        def handler(request):
+            if status is None:
+                raise httpx.ConnectError("refused", request=request)
+            return httpx.Response(status, request=request)
+        return lambda: httpx.Client(transport=httpx.MockTransport(handler))
+
+    assert specs.document(url, "v0.0.37", failing(None), operations) == spec
+    assert specs.document(url, "v0.0.37", failing(503), operations) == spec
+    with pytest.raises(httpx.HTTPStatusError):
+        specs.document(url, "v0.0.37", failing(404), operations)
+    with pytest.raises(httpx.ConnectError):
+        SpecCache(tmp_path / "empty").document(url, "v0.0.37", failing(None), operations)
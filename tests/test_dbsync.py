@@ -0,0 +1,69 @@
+from slurmrest import dbsync
+
+ACCOUNTS = {"a0": {"description": "account 0", "organization": "synthetic"},
+            "a1": {"description": "renamed", "organization": "synthetic"},
+            "new": {"description": "new", "organization": "new"}}
+
+
+def received(slurmrestd, operationId):
+    return [i for i in slurmrestd.slurmrestd.received if i[0] == operationId]
+
+
+def test_create_modify(slurmrestd, connect):
+    # the fake has the users u0…u99, ui with an association with a(i % 10) which is its default
+    users = {"u0": ["a0"], "u1": ["a1", "new"], "u2": ["new"], "unew": ["new", "a0"]}
+    plan, done, errors = dbsync.sync(connect(dbsync.OPERATIONS), "cluster", ACCOUNTS, users)
+    assert errors == []
+    assert plan.accounts == {"a1": ("renamed", "synthetic"), "new": ("new", "new")}
+    assert plan.users == {"u1": ("a1", ["new"]), "u2": ("new", ["new"]), "unew": ("new", ["a0", "new"])}
+    assert plan.unchanged == {"accounts": 1, "users": 1}
+    assert plan.stale == {"u2": ["a2"]}
+    assert done == {"accounts": 2, "users": 3}
+
+    (_, _, data), = received(slurmrestd, "slurmdbd_update_account")
+    assert sorted(i["name"] for i in data["accounts"]) == ["a1", "new"]
+    (_, _, data), = received(slurmrestd, "slurmdbd_update_users")
+    assert {i["name"]: i["default"]["account"] for i in data["users"]} == {"u1": "a1", "u2": "new", "unew": "new"}
+    assert received(slurmrestd, "slurmdbd_delete_user") == []
+    assert received(slurmrestd, "slurmdbd_delete_account") == []
+
+
+def test_dry_run(slurmrestd, connect):
+    plan, done, errors = dbsync.sync(connect(dbsync.OPERATIONS), "cluster", ACCOUNTS, {"unew": ["new"]},
+                                     prune=True, dry_run=True)
+    assert (done, errors) == (dict(), [])
+    assert plan.counts()["users"] == 1
+    assert slurmrestd.slurmrestd.received == []
+
+
+def association(account, user=None, cluster="c0"):
+    return {"account": account, "user": user, "cluster": cluster, "partition": None}
+
+
+def test_prune(slurmrestd, connect):
+    associations = [association(i) for i in ["root", "a", "b", "gone", "shared"]] + \
+                   [association("root", cluster="c1"), association("b", cluster="c1")] + \
+                   [association(a, u) for u, a in [("alice", "a"), ("bob", "gone"), ("carol", "a"), ("carol", "b"),
+                                                   ("dave", "shared")]] + \
+                   [association("b", "alice", "c1"), association("shared", "erin", "c1")]
+    fake = slurmrestd.slurmrestd
+    fake.payloads["slurmdbd_get_associations"] = {"errors": [], "associations": associations}
+    fake.payloads["slurmdbd_get_accounts"] = {"errors": [], "accounts": [
+        {"name": i, "description": i, "organization": i, "associations": []}
+        for i in ["root", "a", "b", "gone", "shared"]]}
+    fake.payloads["slurmdbd_get_users"] = {"errors": [], "users": [
+        {"name": i, "default": {"account": a}} for i, a in [("root", "root"), ("alice", "a"), ("bob", "gone"),
+                                                            ("carol", "a"), ("dave", "shared"), ("erin", "shared")]]}
+
+    accounts = {i: {"description": i, "organization": i} for i in ["a", "b"]}
+    plan, done, errors = dbsync.sync(connect(dbsync.OPERATIONS), "c0", accounts, {"carol": ["a"]}, prune=True)
+    assert errors == []
+    assert (plan.accounts, plan.users) == (dict(), dict())
+    assert done == {"delete_associations": 3, "delete_users": 2, "delete_accounts": 1}
+
+    # alice and the account shared have associations on c1, they are only removed from c0
+    assert [i[1] for i in received(slurmrestd, "slurmdbd_delete_association")] == [
+        {"cluster": "c0", "user": "alice"}, {"cluster": "c0", "user": "carol", "account": "b"},
+        {"cluster": "c0", "account": "shared"}]
+    assert [i[1] for i in received(slurmrestd, "slurmdbd_delete_user")] == [{"user_name": "bob"}, {"user_name": "dave"}]
+    assert [i[1] for i in received(slurmrestd, "slurmdbd_delete_account")] == [{"account_name": "gone"}]
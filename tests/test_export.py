@@ -0,0 +1,97 @@
+import asyncio
+import base64
+import collections
+import re
+
+from slurmrest import export, synthetic, tres
+
+
+def baseline(jobs):
+    # the samples of Export.jobs() aggregated job by job
+    r = collections.defaultdict(float)
+    for job in jobs:
+        state = job["job_state"]
+        cpus = gpus = None
+        for k, v in tres.parse(job["tres_req_str"]):
+            if v is None:
+                continue
+            if cpus is None and re.match("^cpu", k):
+                cpus = v
+            elif gpus is None and re.match(export.GPU, k):
+                gpus = v
+        r["slurmctld_jobs_state_count", (("state", state),)] += 1
+        for label, attribute in [("partition", "partition"), ("account", "account"), ("user", "user_name")]:
+            labels = tuple(sorted([(label, job[attribute] or ""), ("state", state)]))
+            r[f"slurmctld_{label}_jobs_count", labels] += 1
+            r[f"slurmctld_{label}_jobs_cpus_count", labels] += cpus or 0
+            r[f"slurmctld_{label}_jobs_gpus_count", labels] += gpus or 0
+        if state == "PENDING":
+            r["slurmctld_jobs_pending_reason_count",
+              (("partition", job["partition"] or ""), ("reason", job["state_reason"] or ""))] += 1
+    return dict(r)
+
+
+def samples(e):
+    return {(s.name, tuple(sorted(s.labels.items()))): s.value for f in e.registry.collect() for s in f.samples
+            if s.name.startswith("slurmctld_") and "jobs" in s.name}
+
+
+def test_jobs(slurmrestd, connect):
+    fake = slurmrestd.slurmrestd
+    jobs = synthetic.jobs(500, users=40, accounts=7, partitions=5)
+    for i, job in enumerate(jobs):
+        if i % 11 == 0:
+            job["tres_req_str"] = None
+        if i % 13 == 0:
+            job["account"] = None
+        if i % 17 == 0:
+            job["tres_req_str"] = "mem=1G,gres/gpu:a100=2,cpu=3,gres/gpu=8"
+    fake.payloads["slurmctld_get_jobs"] = {"errors": [], "jobs": jobs}
+
+    client = connect(("slurmctld_get_jobs",))
+    e = export.Export()
+    e.jobs(client._.slurmctld_get_jobs())
+    assert samples(e) == baseline(jobs)
+
+    # the groups without jobs are gone
+    fake.payloads["slurmctld_get_jobs"] = {"errors": [], "jobs": jobs[:20]}
+    e.jobs(client._.slurmctld_get_jobs())
+    assert samples(e) == baseline(jobs[:20])
+
+
+def test_clusters(slurmrestd):
+    # beta has no document in the first cycle, it is reported down and connected by the next one
+    fake, failing = slurmrestd.slurmrestd, [True]
+    handle = fake.handle
+
+    def unavailable(method, path, query, headers, body):
+        if path == "/openapi/v3" and failing[0]:
+            return 503, "text/plain", b"unavailable"
+        return handle(method, path, query, headers, body)
+
+    fake.handle = unavailable
+    key = base64.b64encode(b"secret").decode()
+    config = {"clusters": {
+        "alpha": {"url": slurmrestd.url, "key": key},
+        "beta": {"url": slurmrestd.url.replace("/openapi.json", "/openapi/v3"), "key": key, "version": "v0.0.38"},
+    }}
+    e = export.Clusters(export.clusters(config), timeout=10)
+
+    def up():
+        return {s.labels["cluster"]: s.value for f in e.registry.collect() if f.name == "slurmrest_exporter_up"
+                for s in f.samples}
+
+    def clusters(name):
+        return {s.labels["cluster"] for f in e.registry.collect() if f.name == name for s in f.samples}
+
+    async def cycles():
+        assert await e.acollect()
+        r = [up(), clusters("slurmctld_partition_nodes_total_count")]
+        failing[0] = False
+        assert await e.acollect()
+        return r + [up(), clusters("slurmctld_partition_nodes_total_count")]
+
+    assert up() == {"alpha": 0, "beta": 0}
+    first, collected, second, recollected = asyncio.run(cycles())
+    assert first == {"alpha": 1, "beta": 0} and collected == {"alpha"}
+    assert second == {"alpha": 1, "beta": 1} and recollected == {"alpha", "beta"}
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from slurmrest import export_jobs, synthetic
+
+START = synthetic.EPOCH + 3600
+END = START + 2 * 86400
+
+
+def expected():
+    # the fake has scale (100) jobs per day, those submitted after END are not exported
+    return sorted(i["job_id"] for i in synthetic.dbjobs(0, START, END, 86400 // 100) if i["time"]["submission"] < END)
+
+
+def run(client, writer, **kwargs):
+    e = export_jobs.ExportJobs(client, writer, START, END, **kwargs)
+    try:
+        asyncio.run(e.run())
+    finally:
+        writer.close()
+    return e
+
+
+def test_jsonl(connect, tmp_path):
+    e = run(connect(export_jobs.OPERATIONS, asynchronous=True), export_jobs.JSONL(tmp_path / "jobs.jsonl"),
+            step=6 * 3600, workers=3, batch=50)
+    with open(tmp_path / "jobs.jsonl") as f:
+        rows = [json.loads(i) for i in f]
+    assert sorted(i["job_id"] for i in rows) == expected()
+    assert (e.errors, e.windows) == ([], 8)
+    # the jobs running across windows are returned by each of them
+    assert e.duplicates > 0
+
+    row = {i["job_id"]: i for i in rows}[8]
+    assert row["steps"] == 2
+    assert (row["time.submission"], row["tres.allocated.cpu"], row["tres.allocated.gres/gpu"]) == \
+           (synthetic.EPOCH + 7 * 864, 8, 1)
+    assert (row["steps.tres.consumed.max.cpu"], row["steps.tres.consumed.total.cpu"],
+            row["steps.tres.consumed.average.cpu"]) == (8, 160, 4)
+
+
+def test_parquet(connect, tmp_path):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    writer = export_jobs.Parquet(tmp_path / "jobs.parquet")
+    e = run(connect(export_jobs.OPERATIONS, asynchronous=True), writer, step=86400, workers=2, batch=64)
+    assert e.errors == []
+    table = parquet.read_table(tmp_path / "jobs.parquet")
+    assert sorted(table.column("job_id").to_pylist()) == expected()
+
+
+def test_parquet_columns(tmp_path):
+    # the columns of all batches, with the types of all of them
+    parquet = pytest.importorskip("pyarrow.parquet")
+    writer = export_jobs.Parquet(tmp_path / "jobs.parquet")
+    writer.write([{"a": 1, "b": None}, {"a": 2, "b": None}])
+    writer.write([{"a": 2.5, "b": "x", "c": True}])
+    writer.write([{"a": 3, "d": 1}, {"d": "s"}])
+    writer.close()
+    table = parquet.read_table(tmp_path / "jobs.parquet")
+    assert [str(i) for i in table.schema.types] == ["double", "string", "bool", "string"]
+    assert table.to_pylist() == [
+        {"a": 1, "b": None, "c": None, "d": None}, {"a": 2, "b": None, "c": None, "d": None},
+        {"a": 2.5, "b": "x", "c": True, "d": None}, {"a": 3, "b": None, "c": None, "d": "1"},
+        {"a": None, "b": None, "c": None, "d": "s"}]
+    assert parquet.ParquetFile(tmp_path / "jobs.parquet").num_row_groups == 3
+    assert [i.name for i in tmp_path.iterdir()] == ["jobs.parquet"]
+
+
+class Failing(export_jobs.JSONL):
+    def write(self, rows):
+        raise OSError("disk full")
+
+
+def test_writer_error(connect, tmp_path):
+    # the workers are stopped instead of waiting for the writer forever
+    with pytest.raises(OSError, match="disk full"):
+        asyncio.run(asyncio.wait_for(export_jobs.ExportJobs(
+            connect(export_jobs.OPERATIONS, asynchronous=True), Failing(tmp_path / "jobs.jsonl"), START, END,
+            step=3600, workers=4, batch=10).run(), 30))
+
+
+def test_split(slurmrestd, connect, tmp_path):
+    # windows longer than 6h fail, they are split and requested by the workers like the others
+    fake = slurmrestd.slurmrestd
+    handle = fake.handle
+    active = []
+    concurrent = []
+    lock = threading.Lock()
+
+    def limited(method, path, query, headers, body):
+        with lock:
+            active.append(None)
+            concurrent.append(len(active))
+        try:
+            time.sleep(0.02)
+            if "start_time" in query and int(query["end_time"]) - int(query["start_time"]) > 6 * 3600:
+                return 500, "text/plain", b"too many jobs"
+            return handle(method, path, query, headers, body)
+        finally:
+            with lock:
+                active.pop()
+
+    client = connect(export_jobs.OPERATIONS, asynchronous=True)
+    fake.handle = limited
+    e = run(client, export_jobs.JSONL(tmp_path / "jobs.jsonl"), step=86400, workers=2, min_step=3600)
+    with open(tmp_path / "jobs.jsonl") as f:
+        assert sorted(json.loads(i)["job_id"] for i in f) == expected()
+    assert (e.errors, e.windows) == ([], 8)
+    assert max(concurrent) == 2
+
+
+def test_split_errors(slurmrestd, connect, tmp_path):
+    # windows longer than 6h return an error without jobs, they are split like failing ones
+    # down to min_step, where the error is recorded
+    fake = slurmrestd.slurmrestd
+    handle = fake.handle
+    wide = [12 * 3600]
+
+    def busy(method, path, query, headers, body):
+        if "start_time" in query and int(query["end_time"]) - int(query["start_time"]) > wide[0]:
+            data = {"meta": synthetic.meta(), "errors": [{"error": "busy", "error_number": 1007}], "jobs": []}
+            return 200, "application/json", json.dumps(data).encode()
+        return handle(method, path, query, headers, body)
+
+    client = connect(export_jobs.OPERATIONS, asynchronous=True)
+    fake.handle = busy
+    e = run(client, export_jobs.JSONL(tmp_path / "jobs.jsonl"), step=86400, workers=2, min_step=3600)
+    with open(tmp_path / "jobs.jsonl") as f:
+        assert sorted(json.loads(i)["job_id"] for i in f) == expected()
+    assert (e.errors, e.windows) == ([], 4)
+
+    wide[0] = 0
+    e = run(connect(export_jobs.OPERATIONS, asynchronous=True), export_jobs.JSONL(tmp_path / "failed.jsonl"), step=86400, workers=2, min_step=6 * 3600)
+    assert e.windows == 8 and len(e.errors) == 8
+    assert all(end - start == 6 * 3600 and error == "busy" for start, end, error in e.errors)
@@ -0,0 +1,68 @@
+import asyncio
+import functools
+import json
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from slurmrest import improve, synthetic
+
+
+@pytest.fixture
+def documents(tmp_path):
+    # serves tmp_path/src, SimpleHTTPRequestHandler answers If-Modified-Since with 304
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "v0.0.37.json").write_text(json.dumps({"openapi": "3.0.2"}))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(
+        type("Handler", (SimpleHTTPRequestHandler,), {"log_message": lambda *args: None}),
+        directory=tmp_path / "src"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_download(documents, tmp_path):
+    out, store = tmp_path / "out", tmp_path / "store"
+    urls = {"v0.0.37.json": f"{documents}/v0.0.37.json"}
+    assert asyncio.run(improve.download(urls, out, store)) == {"v0.0.37.json": "200 updated"}
+    manifest = (out / "manifest.json").stat()
+
+    # nothing changed, nothing is written
+    assert asyncio.run(improve.download(urls, out, store)) == {"v0.0.37.json": "304 unchanged"}
+    assert (out / "manifest.json").stat().st_ino == manifest.st_ino
+    assert asyncio.run(improve.download(urls, out, store, offline=True)) == {"v0.0.37.json": "unchanged"}
+    assert (out / "manifest.json").stat().st_ino == manifest.st_ino
+
+
+def test_get_fails(documents, tmp_path):
+    # v0.0.38 is missing
+    args = improve.create_parser().parse_args(["get", "--out", str(tmp_path / "out"), "--versions", "0.0.37",
+                                               "0.0.38", "--url", f"{documents}/{{name}}{{version}}.json"])
+    (tmp_path / "src" / "dbv0.0.37.json").write_text("{}")
+    with pytest.raises(SystemExit) as e:
+        args.func(args)
+    assert e.value.code == 1
+    assert sorted(i.name for i in (tmp_path / "out").iterdir()) == [".store", "dbv0.0.37.json", "manifest.json",
+                                                                     "v0.0.37.json"]
+
+
+def test_build(tmp_path):
+    # a broken document does not stop the others
+    old, new = tmp_path / "src", tmp_path / "dst"
+    old.mkdir()
+    (old / "v0.0.37.json").write_text(json.dumps(synthetic.spec(("v0.0.37",))))
+    (old / "v0.0.38.json").write_text("{")
+    status = improve.build(old, new, jobs=2)
+    assert status["v0.0.37.json"] == "patched"
+    assert status["v0.0.38.json"].startswith("error")
+    assert list(json.loads((new / "manifest.json").read_text())) == ["v0.0.37.json"]
+    assert (new / "v0.0.37.json").exists() and not (new / "v0.0.38.json").exists()
+
+    args = improve.create_parser().parse_args(["patch", "--old", str(old), "--new", str(new),
+                                               "--slurm", str(tmp_path / "slurm")])
+    with pytest.raises(SystemExit) as e:
+        args.func(args)
+    assert e.value.code == 1
+    assert improve.build(old, new)["v0.0.37.json"] == "unchanged"
@@ -0,0 +1,108 @@
+import copy
+
+from slurmrest import improve, rules, synthetic
+from slurmrest.rules import Rule, index_items, index_pairs
+
+
+def rewriter(*paths):
+    # rules for the paths only, without a schema
+    return rules.build(rules.tree([Rule((), path, None, None, transform, None) for path, transform in paths]))
+
+
+def test_order():
+    # the outer rule applies first, whatever the order of the rules, so the nested one sees the list
+    paths = [(("a", "*", "b"), index_pairs("k", "v")), (("a",), index_items("name"))]
+    for r in [paths, paths[::-1]]:
+        value = {"a": {"x": {"b": {"0": "s"}}, "y": {"b": {}}}}
+        rewriter(*r)(value)
+        assert value == {"a": [{"name": "x", "b": [{"k": "0", "v": "s"}]}, {"name": "y", "b": []}]}
+
+
+def test_wildcards():
+    each = rewriter((("items", "*", "x"), str.upper))
+    value = {"items": [{"x": "a"}, {"y": "b"}, {"x": None}, 1]}
+    assert each(value) is value
+    assert value == {"items": [{"x": "A"}, {"y": "b"}, {"x": None}, 1]}
+
+    # no list, nothing to descend into
+    value = {"items": {"x": "a"}}
+    each(value)
+    assert value == {"items": {"x": "a"}}
+    each({})
+
+
+def test_transforms():
+    # a transform of each item of a list, next to another branch
+    each = rewriter((("a", "*"), str.upper), (("b",), len))
+    value = {"a": ["x", "y"], "b": "abc"}
+    each(value)
+    assert value == {"a": ["X", "Y"], "b": 3}
+
+    # index_items reuses the items, not dicts are left alone
+    item = {"cpus": 1}
+    assert index_items("node")({"n1": item}) == [{"cpus": 1, "node": "n1"}]
+    assert item["node"] == "n1"
+    assert index_items("node")([1]) == [1]
+    assert index_pairs("core", "type")({"0": "allocated", "1": "unallocated"}) == \
+           [{"core": "0", "type": "allocated"}, {"core": "1", "type": "unallocated"}]
+    assert index_pairs("core", "type")(None) is None
+
+
+def test_transformer():
+    assert rules.transformer("slurmctld_get_nodes") is None
+    assert rules.transformer("slurmctld_get_jobs", ("nodes", "*")) is None
+
+    job = synthetic.jobs(2)[1]
+    expected = baseline_jobs({"jobs": [copy.deepcopy(job)]})["jobs"][0]
+    assert rules.transformer("slurmctld_get_jobs", ("jobs", "*"))(job) == expected
+
+
+def baseline_jobs(data):
+    # OnMessage before the rules
+    for job in data["jobs"]:
+        if "allocated_nodes" not in job["job_resources"]:
+            continue
+        job["job_resources"]["allocated_nodes"] = \
+            [{**i, "node": k} for k, i in job["job_resources"]["allocated_nodes"].items()]
+        for node in job["job_resources"]["allocated_nodes"]:
+            node["cores"] = [{"core": k, "type": v} for k, v in node["cores"].items()]
+            node["sockets"] = [{"socket": k, "type": v} for k, v in node["sockets"].items()]
+    return data
+
+
+def test_rewrite():
+    data = {"jobs": synthetic.jobs(50)}
+    expected = baseline_jobs(copy.deepcopy(data))
+    assert rules.rewrite("slurmctld_get_job", copy.deepcopy(data)) == expected
+    assert rules.rewrite("slurmctld_get_jobs", data) == expected
+    assert rules.rewrite("slurmctld_get_nodes", {"nodes": []}) == {"nodes": []}
+
+
+def baseline_patch(spec, version):
+    # the schema patches apply() made before the rules
+    schemas = spec["components"]["schemas"]
+    schemas[f"{version}_job_resources"]["properties"]["allocated_nodes"] = {
+        "type": "array",
+        "description": "node allocations",
+        "items": {"$ref": f"#/components/schemas/{version}_node_allocation"},
+    }
+    for name in ["core", "socket"]:
+        schemas[f"{version}_node_allocation"]["properties"][f"{name}s"] = {
+            "type": "array",
+            "description": "FIXME",
+            "items": {"type": "object", "properties": {name: {"type": "integer"}, "type": {"type": "string"}}},
+        }
+
+
+def test_apply(monkeypatch):
+    document = synthetic.spec()
+    r = dict()
+    for version in ["v0.0.37", "dbv0.0.37"]:
+        live = f"/slurm{'db' if version.startswith('db') else ''}/v0.0.37"
+        r[version] = improve.apply(copy.deepcopy(document), version, live)
+
+    monkeypatch.setattr(rules, "patch", baseline_patch)
+    for version, spec in r.items():
+        live = f"/slurm{'db' if version.startswith('db') else ''}/v0.0.37"
+        assert spec == improve.apply(copy.deepcopy(document), version, live)
+    assert r["v0.0.37"]["components"]["schemas"]["v0.0.37_node_allocation"]["properties"]["cores"]["type"] == "array"
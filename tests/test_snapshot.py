@@ -0,0 +1,81 @@
+import asyncio
+import types
+
+from slurmrest import export, snapshot
+from slurmrest.snapshot import Incremental, Snapshot
+
+
+def recording(slurmrestd):
+    # the update_time of each request to the fake
+    fake, queries = slurmrestd.slurmrestd, []
+    handle = fake.handle
+
+    def recorded(method, path, query, headers, body):
+        queries.append(query.get("update_time"))
+        return handle(method, path, query, headers, body)
+
+    fake.handle = recorded
+    return fake, queries
+
+
+def test_snapshot(slurmrestd, connect):
+    s = Snapshot(connect(export.OPERATIONS), "slurmctld_get_nodes", "nodes", "name")
+    fake, queries = recording(slurmrestd)
+
+    # the first poll has no previous state and gets the complete collection
+    first = s.poll()
+    assert queries == [None]
+    assert s.changed and s.last_update == fake.last_update
+    assert len(s.items) == 100 and first.nodes[0].name in s.items
+
+    # nothing changed, the previous response
+    assert s.poll() is first
+    assert queries[-1] == str(fake.last_update)
+    assert not s.changed and len(s.items) == 100
+
+    # a change replaces the snapshot, removed keys are gone
+    fake.scale = 60
+    fake.touch()
+    second = s.poll()
+    assert s.changed and second is not first
+    assert s.last_update == fake.last_update
+    assert set(s.items) == {i.name for i in second.nodes}
+    assert len(s.items) == 60 and not set(s.items) - {i.name for i in first.nodes}
+
+
+def test_snapshot_errors():
+    responses = [
+        types.SimpleNamespace(errors=[], last_update=10, nodes=[types.SimpleNamespace(name="a")]),
+        types.SimpleNamespace(errors=[{"error": "busy"}], nodes=[]),
+        types.SimpleNamespace(errors=[], last_update={"set": True, "number": 10}, nodes=[]),
+    ]
+    client = types.SimpleNamespace(request=lambda operationId, parameters: responses.pop(0))
+    s = Snapshot(client, "slurmctld_get_nodes", "nodes", "name")
+    first = s.poll()
+
+    # errors are returned but not merged
+    assert s.poll().errors and s.changed
+    assert set(s.items) == {"a"} and s.last_update == 10
+    assert s.poll() is first and not s.changed
+
+
+def test_timestamp():
+    assert snapshot.timestamp(None) is None
+    assert snapshot.timestamp(5) == 5
+    assert snapshot.timestamp({"set": True, "number": 5}) == 5
+    assert snapshot.timestamp({"set": False, "number": 0}) is None
+    assert snapshot.timestamp(types.SimpleNamespace(set=True, number=7)) == 7
+
+
+def test_incremental(slurmrestd, connect):
+    client = Incremental(connect(export.ASYNC_OPERATIONS, asynchronous=True), export.SNAPSHOTS)
+    fake, queries = recording(slurmrestd)
+
+    async def poll():
+        return [await client._.slurmctld_get_jobs(), await client._.slurmctld_get_jobs(),
+                await client._.slurmctld_get_partitions()]
+
+    first, second, partitions = asyncio.run(poll())
+    assert second is first and len(first.jobs) == 100
+    assert queries == [None, str(fake.last_update), None]
+    assert partitions.partitions
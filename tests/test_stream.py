@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+import pytest
+
+from slurmrest import rules, stream, synthetic
+
+VALID = [
+    '{"jobs": []}',
+    '{}',
+    '{"jobs": [1, 2.5e3, -0, true, false, null, "a"]}',
+    '{"meta": {"plugin": {"type": "openapi/v0.0.37"}}, "errors": [], "jobs": [{"job_id": 1, "name": "a,b]}"}, '
+    '{"job_id": 2, "name": "\\"\\\\[{"}], "warnings": []}',
+    ' { "jobs" : [ [ [ ] , { } ] , [ 1 , [ 2 ] ] ] , "x" : 123 } ',
+    '{"jobs": [{"name": "gr\\u00fc\\u00dfe ü€\U0001f600"}], "n": 1234567890}',
+    '{"errors": [{"error": "x"}]}',
+    '{"jobs": null}',
+]
+
+INVALID = [
+    '{"jobs": [,,1]}',
+    '{"jobs": [,1]}',
+    '{"jobs": [1,]}',
+    '{"jobs": [1 2]}',
+    '{"jobs": [1,,2]}',
+    '{"jobs": [1}',
+    '{"jobs": [{"a": 1,}]}',
+    '{"jobs": [], }',
+    '{, "jobs": []}',
+    '{"jobs": [], "x": 1,}',
+    '{"jobs" []}',
+    '{jobs: []}',
+    '{"jobs": [tru]}',
+    '{"jobs": [1]]}',
+    '{"jobs": [1]} x',
+    '{"jobs": ["a]}',
+    '{"jobs": [1]',
+    '[1]',
+]
+
+
+def parse(chunks):
+    items = stream.Items("jobs")
+    r = []
+    for i in chunks:
+        r.extend(items.feed(i))
+    r.extend(items.close())
+    return r, items.data
+
+
+def expected(document):
+    data = json.loads(document)
+    items = data.pop("jobs") if isinstance(data.get("jobs"), list) else []
+    return items, data
+
+
+def splits(document):
+    # the document in one piece, byte by byte and split in two at every byte boundary
+    data = document.encode()
+    yield [data]
+    yield [data[i:i + 1] for i in range(len(data))]
+    for i in range(1, len(data)):
+        yield [data[:i], data[i:]]
+
+
+@pytest.mark.parametrize("document", VALID)
+def test_valid(document):
+    for chunks in splits(document):
+        assert parse(chunks) == expected(document), chunks
+
+
+@pytest.mark.parametrize("document", INVALID)
+def test_invalid(document):
+    if document != "[1]":
+        with pytest.raises(ValueError):
+            json.loads(document)
+    for chunks in splits(document):
+        with pytest.raises(ValueError):
+            parse(chunks)
+
+
+def test_incremental():
+    # the elements are returned as soon as they are complete
+    items = stream.Items("jobs")
+    assert items.feed(b'{"jobs": [{"a": 1}, {"a"') == [{"a": 1}]
+    assert items.feed(b': 2}, 3') == [{"a": 2}]
+    assert items.feed(b']}') == [3]
+    assert items.close() == []
+
+
+def test_fake(connect):
+    s = stream.Stream(connect(("slurmctld_get_jobs",)), "slurmctld_get_jobs", "jobs", chunk_size=1000)
+    jobs = list(s)
+    assert jobs == rules.rewrite("slurmctld_get_jobs", synthetic.response("slurmctld_get_jobs", 100))["jobs"]
+    assert s.data["errors"] == []
+
+
+def test_fake_async(connect):
+    async def items(s):
+        return [i async for i in s]
+
+    client = connect(("slurmctld_get_nodes",), asynchronous=True)
+    s = stream.Stream(client, "slurmctld_get_nodes", "nodes", fields=["name", "state"], chunk_size=1000)
+    nodes = asyncio.run(items(s))
+    assert [(i.name, i.state) for i in nodes] == [(i["name"], i["state"]) for i in synthetic.nodes(100)]
+    assert s.data["errors"] == []
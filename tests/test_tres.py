@@ -0,0 +1,54 @@
+from slurmrest import export, tres
+from slurmrest.tres import Matcher
+
+
+def test_units():
+    # memory sizes in MB
+    assert tres.number("64") == 64
+    assert tres.number("256000M") == 256000
+    assert tres.number("1G") == 1024
+    assert tres.number("1.5G") == 1536
+    assert tres.number("2T") == 2 * 1024 ** 2
+    assert tres.number("1P") == 1024 ** 3
+    assert tres.number("512K") == 0.5
+    assert tres.number("1.5") == 1.5
+    assert tres.number("") is None
+    assert tres.number("4X") is None
+    assert tres.parse("cpu=64,mem=256000M,billing=64,gres/gpu=4,gres/gpu:a100=4") == (
+        ("cpu", 64), ("mem", 256000), ("billing", 64), ("gres/gpu", 4), ("gres/gpu:a100", 4))
+    assert tres.parse("cpu=1,,node=,fs/disk") == (("cpu", 1), ("node", None), ("fs/disk", None))
+
+
+def test_interning():
+    # two strings built separately share the keys, the parsed tuples are cached
+    a, b = "".join(["cpu=1,", "mem=2G"]), "".join(["cpu=1,", "mem=2G"])
+    assert a is not b
+    assert tres.parse(a) is tres.parse(b)
+    c = tres.parse("".join(["cpu=", "2"]))
+    assert c[0][0] is tres.parse(a)[0][0]
+
+    m = Matcher(["^cpu"])
+    hits = m.vector.cache_info().hits
+    assert m.vector(a) is m.vector(b)
+    assert m.vector.cache_info().hits == hits + 1
+
+
+def test_first_match():
+    # the first pattern matching a key, the first key of a resource with a value
+    m = Matcher(["^gres/gpu", "^gres/gpu:a100", "^cpu"])
+    assert m.vector("gres/gpu:a100=2,gres/gpu=4,cpu=1,cpu=2") == (2, None, 1)
+    assert m.resource("gres/gpu:a100") == 0
+    assert m.resource("mem") is None
+
+    m = Matcher(["^cpu", export.GPU])
+    assert m.vector("gres/gpu=x,cpu=8,gres/gpu=4") == (8, 4)
+    assert m.vector("gres/gpu:a=1,gres/gpu=4") == (None, 1)
+
+
+def test_empty():
+    assert tres.parse("") == ()
+    assert tres.parse(None) == ()
+    m = Matcher(["^cpu", "^mem"])
+    assert m.vector("") == (None, None)
+    assert m.vector(None) == (None, None)
+    assert Matcher([]).vector("cpu=1") == ()